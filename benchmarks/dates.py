@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Compare psvue.parse_datetime() with the iso8601 based parsing it replaced, for the airing dates of a
+999 episode detailed listing. Every date is parsed twice with localize=True, as list_programs() and
+return_info() do.
+
+    python -m benchmarks.dates [--runs 20]
+
+Prints one JSON object per variant with the median seconds per listing.
+"""
+import sys
+import json
+import time
+import calendar
+import argparse
+from datetime import datetime
+
+import iso8601
+
+from resources.lib import psvue as psvue_module
+from resources.lib.psvue import psvue
+
+
+def iso8601_parse_datetime(iso8601_string):
+    """The parse_datetime(iso8601_string, localize=True) that psvue had before the fast parser."""
+    utc_dt = iso8601.parse_date(iso8601_string)
+    timestamp = calendar.timegm(utc_dt.timetuple())
+    local_dt = datetime.fromtimestamp(timestamp)
+    return local_dt.replace(microsecond=utc_dt.microsecond)
+
+
+def airing_dates(count=999, start=1488398400):
+    return [time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(start + index * 1800)) for index in range(count)]
+
+
+def listing(parse, dates):
+    for date in dates:
+        parse(date)
+        parse(date)
+
+
+def clear_memo():
+    psvue_module._parsed_datetimes.clear()
+    psvue_module._utc_offsets.clear()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(setup, parse, dates, runs):
+    timings = []
+    for _ in range(runs):
+        setup()
+        started = time.time()
+        listing(parse, dates)
+        timings.append(time.time() - started)
+    return median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark airing date parsing.')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    vue = psvue.__new__(psvue)  # parse_datetime() needs no instance state
+    fast_parse = lambda date: vue.parse_datetime(date, localize=True)
+    dates = airing_dates()
+    mismatches = [date for date in dates if fast_parse(date) != iso8601_parse_datetime(date)]
+    if mismatches:
+        sys.exit('parse_datetime() disagrees with iso8601 for: %s' % mismatches[:5])
+
+    results = [
+        ('iso8601', measure(lambda: None, iso8601_parse_datetime, dates, args.runs)),
+        ('parse_datetime_cold', measure(clear_memo, fast_parse, dates, args.runs)),
+        ('parse_datetime_warm', measure(lambda: None, fast_parse, dates, args.runs))
+    ]
+    for name, seconds in results:
+        print(json.dumps({'variant': name, 'seconds_per_listing': round(seconds, 5),
+                          'speedup': round(results[0][1] / seconds, 1)}, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
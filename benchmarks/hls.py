@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Compare hls.parse_master_playlist() with the m3u8 based manifest parsing it replaced, from the manifest
+content to the URL of the highest bitrate variant, as play() gets it with the highest bitrate setting.
+The manifests are benchmarks/fixtures/master.m3u8 and a generated one with 24 variants. Importing each
+parser is measured in a fresh Python process, as a plugin invocation pays for it once.
+
+    python -m benchmarks.hls [--runs 20] [--loops 1000]
+
+Prints one JSON object per manifest and parser with the median microseconds per manifest, and one per
+parser with the import time.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from urllib import urlencode
+
+import m3u8
+
+from resources.lib.hls import parse_master_playlist
+from tests.kodi_env import ROOT
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+MANIFEST_URL = 'https://vue-live.totsuko.tv/hls/20000/master.m3u8?exp=1488402000'
+HEADER = {'Cookie': 'reqPayload=0123456789abcdef',
+          'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64; rv:52.0) Gecko/20100101 Firefox/52.0'}
+
+
+def m3u8_parse_manifest(content, manifest_url, header):
+    """The parse_m3u8_manifest() that psvue had before parse_master_playlist(): bitrate strings to stream URLs."""
+    streams = {}
+    m3u8_obj = m3u8.loads(content)
+    for playlist in m3u8_obj.playlists:
+        bitrate = int(playlist.stream_info.bandwidth) / 1000
+        if playlist.uri.startswith('http'):
+            stream_url = playlist.uri
+        else:
+            stream_url = manifest_url[:manifest_url.rfind('/') + 1] + playlist.uri
+        streams[str(bitrate)] = stream_url + '|' + urlencode(header)
+    return streams
+
+
+def m3u8_highest(content, manifest_url, header):
+    """The old parsing followed by the sort select_bitrate() did to find the highest bitrate."""
+    streams = m3u8_parse_manifest(content, manifest_url, header)
+    bitrates = list(streams)
+    bitrates.sort(key=int, reverse=True)
+    return streams[bitrates[0]]
+
+
+def parser_highest(content, manifest_url, header):
+    return parse_master_playlist(content, manifest_url, '|' + urlencode(header))[0]['url']
+
+
+def generated_manifest(variants=24):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:4',
+             '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac",NAME="English",DEFAULT=YES,URI="audio/index.m3u8"']
+    for index in range(variants):
+        bandwidth = 300000 + index * 350000
+        lines.append('#EXT-X-STREAM-INF:BANDWIDTH=%s,RESOLUTION=%sx%s,CODECS="avc1.64001f,mp4a.40.2",AUDIO="aac"'
+                     % (bandwidth, 416 + index * 64, 234 + index * 36))
+        lines.append('%s/index.m3u8' % bandwidth)
+    return '\n'.join(lines) + '\n'
+
+
+def load_manifest():
+    with open(os.path.join(FIXTURES, 'master.m3u8'), 'r') as fh_manifest:
+        return fh_manifest.read()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(highest, content, runs, loops):
+    timings = []
+    for _ in range(runs):
+        started = time.time()
+        for _ in range(loops):
+            highest(content, MANIFEST_URL, HEADER)
+        timings.append((time.time() - started) / loops)
+    return median(timings)
+
+
+def import_time(module, runs):
+    script = 'import sys, time; sys.path.insert(0, %r); started = time.time(); import %s; print(time.time() - started)'
+    timings = [float(subprocess.check_output([sys.executable, '-c', script % (ROOT, module)], cwd=ROOT))
+               for _ in range(runs)]
+    return median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark master playlist parsing.')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--loops', type=int, default=1000)
+    args = parser.parse_args()
+
+    manifests = [('fixture', load_manifest()), ('generated', generated_manifest())]
+    for name, content in manifests:
+        variants = parse_master_playlist(content, MANIFEST_URL, '|' + urlencode(HEADER))
+        streams = dict((str(variant['bitrate']), variant['url']) for variant in variants)
+        if streams != m3u8_parse_manifest(content, MANIFEST_URL, HEADER):
+            sys.exit('parse_master_playlist() disagrees with m3u8 for the %s manifest' % name)
+
+        m3u8_seconds = measure(m3u8_highest, content, args.runs, args.loops)
+        parser_seconds = measure(parser_highest, content, args.runs, args.loops)
+        for variant, seconds in (('m3u8', m3u8_seconds), ('parse_master_playlist', parser_seconds)):
+            print(json.dumps({'manifest': name, 'variants': len(variants), 'variant': variant,
+                              'us_per_manifest': round(seconds * 1e6, 1),
+                              'speedup': round(m3u8_seconds / seconds, 1)}, sort_keys=True))
+
+    for variant, module in (('m3u8', 'm3u8'), ('parse_master_playlist', 'resources.lib.hls')):
+        print(json.dumps({'variant': variant, 'import_ms': round(import_time(module, args.runs) * 1000, 2)},
+                         sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Time every router action against a local stand-in for the PlayStation Vue API. A threaded HTTP server
+replays the responses in benchmarks/fixtures (config, menu, sortings, 999 item program lists, the guide,
+streams and master playlists) and every https request the plugin makes is sent to it instead. Every run
+is a fresh Python process that runs default.py against the Kodi stubs in tests/kodi, like a Kodi plugin
+invocation, with a signed in session unless the action is login.
+
+    python -m benchmarks.navigation [--runs 5] [--root /path/to/other/checkout] [--set page_size=0 ...]
+
+The first run of an action starts from an empty add-on profile (cold), the others reuse it (warm).
+--set overrides the add-on settings, which otherwise have their defaults from resources/settings.xml.
+Prints one JSON object per action with the wall time, the requests and response bytes the server handled
+and the peak resident memory of the plugin process, for the cold run and the median of the warm runs.
+Wall times include importing requests, which every action but dialog needs anyway.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from urllib import urlencode, unquote
+from datetime import datetime, timedelta
+
+from tests.kodi_env import ROOT
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PROGRAM_COUNT = 999
+CHANNEL_COUNT = 200
+EPISODE_COUNT = 30
+AIRINGS_PER_CHANNEL = 48  # a day of half hour slots
+SHOWS = ['The Evening Report', 'Kitchen Rivals', 'Harbor Patrol', 'Late Night Live', 'Home Court', 'Deep Space',
+         'Garden Rescue', 'Cold Case Files', 'Market Watch', 'Wild Coast']
+PAGE_PATTERN = re.compile(r'/offset/(\d+)/size/(\d+)')
+
+TWO_AIRINGS = json.dumps([{'title': 'NBC (LIVE)', 'airing_id': 50000000, 'channel_id': 20000},
+                          {'title': 'NBC (CATCHUP)', 'airing_id': 50000001, 'channel_id': 20000}])
+ACTIONS = [
+    # (name, plugin paramstring, what the keyboard types, what the dialogs answer)
+    ('login', '', None, []),  # list_categories without a session
+    ('list_categories', '', None, []),
+    ('dialog', '?action=dialog&dialog_type=ok&heading=Error&message=Test', None, []),
+    ('list_sortings_category', '?' + urlencode({'action': 'list_sortings_category', 'type': 'category',
+                                                'uri': 'category/live.json'}), None, []),
+    ('list_sortings_channel', '?' + urlencode({'action': 'list_sortings_channel', 'type': 'channel',
+                                               'channel_id': '20000'}), None, []),
+    ('list_programs', '?' + urlencode({'action': 'list_programs', 'request_method': 'get',
+                                       'uri': 'programs/popular/sort/popularity/offset/<offset>/size/<size>'}),
+     None, []),
+    ('list_programs_post', '?' + urlencode({'action': 'list_programs', 'request_method': 'post',
+                                            'uri': 'favorites/items/sort/recent/offset/<offset>/size/<size>'}),
+     None, []),
+    ('list_programs_detailed', '?' + urlencode({'action': 'list_programs_detailed', 'request_method': 'get',
+                                                'program_id': '1000000',
+                                                'expiration_filter': '2017-01-01T00:00:00'}), None, []),
+    ('search', '?action=search', 'evening', []),
+    ('play', '?' + urlencode({'action': 'play', 'airings_data': TWO_AIRINGS}), None, [0]),
+    ('play_channel', '?action=play_channel&channel_id=20000', None, []),
+    ('list_all_channels', '?action=list_all_channels', None, []),
+    ('list_guide', '?action=list_guide', None, []),
+    ('export_pvr', '?action=export_pvr', None, [])
+]
+SETTINGS = {
+    'email': 'benchmark@example.com',
+    'password': 'benchmark',
+    'use_service': 'false'  # the plugin process talks to the API itself
+}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as fh_fixture:
+        if name.endswith('.json'):
+            return json.loads(fh_fixture.read())
+        return fh_fixture.read()
+
+
+def api_date(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+class FixtureAPI(object):
+    """The responses of the stand-in server. The program, episode and channel lists are generated from the
+    item fixtures once, with airing dates around now so the guide has something on."""
+
+    def __init__(self):
+        now = int(time.time()) // 1800 * 1800
+        self.now = now
+        self.program = load_fixture('program.json')
+        self.channel = load_fixture('channel_item.json')
+        self.programs = [self.program_item(index, now) for index in range(PROGRAM_COUNT)]
+        self.channels = [self.channel_item(index, now) for index in range(CHANNEL_COUNT)]
+        self.lock = threading.Lock()
+        self.responses = {}  # path -> (status, headers, content), the fixtures never change while serving
+
+    def program_item(self, index, now, detailed=False):
+        item = dict(self.program)
+        item['id'] = self.program['id'] + index
+        if detailed:
+            item['display_episode_title'] = 'Episode %s' % (index + 1)
+            item['episode_num'] = index + 1
+            item['airing_date'] = api_date(now - (EPISODE_COUNT - index) * 86400)
+            item['detailed'] = True
+        else:
+            item['title'] = '%s %s' % (SHOWS[index % len(SHOWS)], index // len(SHOWS) + 1)
+            item['airing_date'] = api_date(now + (index % 48 - 24) * 1800)
+        item['airings'] = [dict(airing, airing_id=airing['airing_id'] + index * 10)
+                           for airing in self.program['airings']]
+        return item
+
+    def channel_item(self, index, now):
+        item = dict(self.channel)
+        item['id'] = self.channel['id'] + index
+        item['title'] = '%s %s' % (self.channel['title'], index + 1)
+        template = self.channel['airings'][0]
+        item['airings'] = [dict(template, airing_id=template['airing_id'] + index * 1000 + slot,
+                                channel_id=item['id'], channel_name=item['title'],
+                                title=SHOWS[(index + slot) % len(SHOWS)],
+                                display_episode_title='Episode %s' % (slot + 1),
+                                airing_date=api_date(now + (slot - AIRINGS_PER_CHANNEL // 2) * 1800))
+                           for slot in range(AIRINGS_PER_CHANNEL)]
+        return item
+
+    def respond(self, path):
+        with self.lock:
+            response = self.responses.get(path)
+        if response is None:
+            response = self.build(path)
+            with self.lock:
+                self.responses[path] = response
+        return response
+
+    def build(self, path):
+        """Return the status, headers and content for a request path, which starts with the API host."""
+        url_path = urlparse.urlparse(path).path
+        if url_path.endswith('/oauth/authorize'):
+            return self.json_response({}, [('X-NP-GRANT-CODE', 'benchmark-code')])
+        if url_path.endswith('/ssocookie'):
+            return self.json_response({'npsso': 'benchmark'}, [('Set-Cookie', 'npsso=benchmark; Path=/')])
+        if url_path.endswith('/oauth2/token'):
+            response = load_fixture('authenticate.json')
+            response['body']['expiry_date'] = api_date(time.time() + 4 * 3600)
+            return self.json_response(response)
+        if url_path.endswith('/pad/configuration.json'):
+            return self.json_response(load_fixture('configuration.json'))
+        if url_path.endswith('/pad/menu.json'):
+            return self.json_response(load_fixture('menu.json'))
+        if '/pad/category/' in url_path:
+            return self.json_response(load_fixture('category.json'))
+        if url_path.endswith('/pad/channel.json'):
+            return self.json_response(load_fixture('channel.json'))
+        if url_path.endswith('/profile/ids'):
+            return self.json_response(load_fixture('profiles.json'))
+        if re.search(r'/profile/\d+$', url_path):
+            return self.json_response(load_fixture('profile.json'))
+        match = re.search(r'/stream/(?:airing|channel)/(\d+)$', url_path)
+        if match:
+            response = load_fixture('stream.json')
+            response['body']['video'] = response['body']['video'].replace('<id>', match.group(1)).replace(
+                '<expires>', str(int(time.time()) + 3600))
+            cookie = 'reqPayload=%s; Path=/' % hashlib.sha1(match.group(1)).hexdigest()
+            return self.json_response(response, [('Set-Cookie', cookie)])
+        if url_path.endswith('/master.m3u8'):
+            return 200, [('Content-Type', 'application/vnd.apple.mpegurl')], load_fixture('master.m3u8')
+
+        match = PAGE_PATTERN.search(url_path)
+        if not match:
+            return 404, [('Content-Type', 'text/plain')], 'No fixture for %s' % path
+        offset, size = int(match.group(1)), int(match.group(2))
+        if '/details/items/program/' in url_path:
+            items = [self.program_item(index, self.now, detailed=True) for index in range(EPISODE_COUNT)]
+        elif '/channels/items/' in url_path:
+            items = self.channels
+        else:
+            search = re.search(r'/search/items/([^/]+)/', url_path)
+            if search:
+                query = unquote(search.group(1)).lower()
+                items = [item for item in self.programs if query in item['title'].lower()]
+            else:
+                items = self.programs
+        return self.json_response({'header': {'code': 0, 'status': 'OK'},
+                                   'body': {'items': items[offset:offset + size], 'total': len(items)}})
+
+    def json_response(self, response, extra_headers=()):
+        content = json.dumps(response)
+        headers = [('Content-Type', 'application/json'), ('ETag', '"%s"' % hashlib.md5(content).hexdigest())]
+        return 200, headers + list(extra_headers), content
+
+
+class FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive like the API hosts do
+
+    def respond(self):
+        if self.headers.get('Content-Length'):
+            self.rfile.read(int(self.headers['Content-Length']))
+        status, headers, content = self.server.api.respond(self.path)
+        etag = dict(headers).get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            status, content = 304, ''
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.count(len(content))
+
+    do_GET = do_PUT = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serve the FixtureAPI on a free local port and count the requests and response bytes."""
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FixtureHandler)
+        self.api = FixtureAPI()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def count(self, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def reset(self):
+        """Return the requests and bytes counted since the last reset."""
+        with self.lock:
+            counted = self.requests, self.bytes_sent
+            self.requests = 0
+            self.bytes_sent = 0
+        return counted
+
+
+def replay_to(port):
+    """Send every https request of this process to the fixture server on port, over plain HTTP.
+    The host moves into the path, e.g. https://host/path becomes http://127.0.0.1:port/host/path."""
+    from requests.adapters import HTTPAdapter
+    send = HTTPAdapter.send
+
+    def replay_send(self, request, **kwargs):
+        if request.url.startswith('https://'):
+            # the session still sees (and files cookies under) the original URL
+            request = request.copy()
+            request.url = 'http://127.0.0.1:%s/%s' % (port, request.url[len('https://'):])
+        return send(self, request, **kwargs)
+
+    HTTPAdapter.send = replay_send
+
+
+def default_settings(addon_root):
+    with open(os.path.join(addon_root, 'resources', 'settings.xml'), 'r') as fh_settings:
+        settings_xml = fh_settings.read()
+    return dict(re.findall(r'<setting id="([^"]+)"[^>]*?default="([^"]*)"', settings_xml))
+
+
+def sign_in(profile):
+    """Write the credentials of a session that's valid for a day, with a profile selected."""
+    credentials = {
+        'device_id': 'benchmark-device',
+        'code': 'benchmark-code',
+        'expiry_date': (datetime.utcnow() + timedelta(days=1)).isoformat(),
+        'profile_id': 1,
+        'profile_data': {'profile_data': {'favorites': []}},
+        'profile_data_time': time.time()
+    }
+    with open(os.path.join(profile, 'credentials'), 'w') as fh_credentials:
+        fh_credentials.write(json.dumps(credentials))
+
+
+CHILD = '''
+import sys, time, json, resource
+started = time.time()
+sys.path.insert(0, %(root)r)
+from benchmarks.navigation import replay_to
+replay_to(%(port)d)
+from tests import kodi_env
+import xbmc, xbmcgui, xbmcplugin
+kodi_env.configure(%(profile)r, %(settings)r, root=%(addon_root)r)
+xbmc.Keyboard.text = %(text)r
+xbmcgui.Dialog.answers[:] = %(answers)r
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+exit_code = None
+try:
+    kodi_env.load_script('default', ['plugin://plugin.video.psvue/', '1', %(paramstring)r], root=%(addon_root)r,
+                         main=True)
+except SystemExit as error:
+    exit_code = error.code
+wall_time = time.time() - started
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'wall_time': wall_time, 'peak_rss_kb': peak_rss, 'rss_growth_kb': peak_rss - rss_before,
+                  'items': len(xbmcplugin.items), 'resolved': len(xbmcplugin.resolved),
+                  'dialogs': xbmcgui.Dialog.shown, 'exit_code': exit_code}))
+'''
+
+
+def run(server, addon_root, profile, settings, paramstring, text, answers):
+    """Run the plugin once in a fresh process. Return what it reported plus what the server counted."""
+    script = CHILD % {'root': ROOT, 'port': server.server_address[1], 'profile': profile, 'settings': settings,
+                      'addon_root': addon_root, 'paramstring': paramstring, 'text': text, 'answers': answers}
+    server.reset()
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=addon_root)
+    result = json.loads(output.strip().splitlines()[-1])
+    result['requests'], result['bytes'] = server.reset()
+    return result
+
+
+def metrics(results):
+    """The median of each measurement over results."""
+    def median(key):
+        values = sorted(result[key] for result in results)
+        return values[len(values) // 2]
+    return {
+        'wall_ms': round(median('wall_time') * 1000, 1),
+        'requests': median('requests'),
+        'bytes': median('bytes'),
+        'peak_rss_kb': median('peak_rss_kb'),
+        'rss_growth_kb': median('rss_growth_kb')
+    }
+
+
+def measure(server, addon_root, settings, action, paramstring, text, answers, runs):
+    profile = tempfile.mkdtemp()
+    try:
+        if action != 'login':
+            sign_in(profile)
+        results = [run(server, addon_root, profile, settings, paramstring, text, answers) for _ in range(runs)]
+    finally:
+        shutil.rmtree(profile)
+    return {
+        'action': action,
+        'cold': metrics(results[:1]),
+        'warm': metrics(results[1:]) if runs > 1 else None,
+        # what the cold run did, to tell a broken action from a fast one
+        'items': results[0]['items'],
+        'resolved': results[0]['resolved'],
+        'dialogs': results[0]['dialogs'],
+        'exit_code': results[0]['exit_code']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every router action against replayed API fixtures.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--root', default=ROOT, help='the add-on checkout to measure')
+    parser.add_argument('--set', action='append', default=[], metavar='SETTING=VALUE',
+                        help='override an add-on setting')
+    parser.add_argument('--action', action='append', help='only measure these actions')
+    args = parser.parse_args()
+    addon_root = os.path.abspath(args.root)
+    settings = default_settings(addon_root)
+    settings.update(SETTINGS)
+    settings.update(setting.split('=', 1) for setting in args.set)
+
+    server = FixtureServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        for action, paramstring, text, answers in ACTIONS:
+            if args.action and action not in args.action:
+                continue
+            result = measure(server, addon_root, settings, action, paramstring, text, answers, args.runs)
+            print(json.dumps(result, sort_keys=True))
+            sys.stdout.flush()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
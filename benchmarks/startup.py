@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Measure what starting the plugin costs for every router action: the time to import default.py
+(settings, psvue construction and the imports it pulls in) and which heavy modules get loaded.
+Every run is a fresh Python process, like a Kodi plugin invocation.
+
+    python -m benchmarks.startup [--runs 10] [--root /path/to/other/checkout]
+
+--root loads default.py from another checkout (e.g. a `git worktree` of an older commit) against the
+same Kodi stubs, so two versions can be compared. Prints one JSON object per action.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from tests.kodi_env import ROOT
+
+ACTIONS = [
+    ('list_categories', ''),
+    ('dialog', '?action=dialog&dialog_type=ok&heading=Error&message=Test'),
+    ('list_sortings_category', '?action=list_sortings_category&type=category&uri=categories/all'),
+    ('list_programs', '?action=list_programs&request_method=get&uri=sortings/all'),
+    ('list_programs_detailed', '?action=list_programs_detailed&request_method=get&program_id=1'
+                               '&expiration_filter=2017-01-01T00:00:00'),
+    ('play', '?action=play&airings_data=[]'),
+    ('play_channel', '?action=play_channel&channel_id=1'),
+    ('search', '?action=search'),
+    ('list_guide', '?action=list_guide'),
+    ('export_pvr', '?action=export_pvr'),
+    ('list_all_channels', '?action=list_all_channels')
+]
+HEAVY_MODULES = ['requests', 'iso8601', 'm3u8', 'sqlite3', 'SocketServer', 'cookielib', 'xml.sax.saxutils',
+                 'resources.lib.guide', 'resources.lib.export', 'resources.lib.remote', 'resources.lib.throughput']
+
+CHILD = '''
+import sys, time, json
+sys.path.insert(0, %(root)r)
+from tests import kodi_env
+kodi_env.configure(%(profile)r, root=%(addon_root)r)
+before = set(sys.modules)
+started = time.time()
+kodi_env.load_script('default', ['plugin://plugin.video.psvue/', '1', %(paramstring)r], root=%(addon_root)r)
+elapsed = time.time() - started
+loaded = [name for name in set(sys.modules) - before if sys.modules[name] is not None]
+print(json.dumps({'import_time': elapsed, 'modules': len(loaded),
+                  'heavy_modules': sorted(name for name in %(heavy)r if name in loaded)}))
+'''
+
+
+def measure(addon_root, paramstring, runs):
+    profile = tempfile.mkdtemp()
+    results = []
+    try:
+        for _ in range(runs):
+            script = CHILD % {'root': ROOT, 'profile': profile, 'addon_root': addon_root, 'paramstring': paramstring,
+                              'heavy': HEAVY_MODULES}
+            output = subprocess.check_output([sys.executable, '-c', script], cwd=addon_root)
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(profile)
+    times = sorted(result['import_time'] for result in results)
+    return {
+        'import_ms': round(times[len(times) // 2] * 1000, 2),
+        'modules': results[-1]['modules'],
+        'heavy_modules': results[-1]['heavy_modules']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the plugin startup per router action.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--root', default=ROOT, help='the add-on checkout to measure')
+    args = parser.parse_args()
+    for action, paramstring in ACTIONS:
+        result = measure(os.path.abspath(args.root), paramstring, args.runs)
+        result['action'] = action
+        print(json.dumps(result, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
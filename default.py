@@ -7,9 +7,14 @@ import os
 import urllib
 import urlparse
 import json
+import time
 from datetime import datetime
+from contextlib import contextmanager
 
 from resources.lib.psvue import psvue
+from resources.lib.models import Program
+from resources.lib.artwork import ArtworkResolver
+from resources.lib.utils import append_rolling
 
 import xbmc
 import xbmcaddon
@@ -17,6 +22,9 @@ import xbmcvfs
 import xbmcgui
 import xbmcplugin
 
+invocation_started = time.time()
+phase_timings = {}  # seconds spent in each phase of this invocation, see timed()
+timing_phases = False  # only when the invocation stats are logged or recorded
 addon = xbmcaddon.Addon()
 addon_path = xbmc.translatePath(addon.getAddonInfo('path'))
 addon_profile = xbmc.translatePath(addon.getAddonInfo('profile'))
@@ -37,7 +45,42 @@ if addon.getSetting('verify_ssl') == 'false':
 else:
     verify_ssl = True
 
-vue = psvue(addon_profile, True, verify_ssl)
+artwork_widths = [0, 1920, 1280, 640]  # 0 means the largest available image
+artwork_width = artwork_widths[int(addon.getSetting('artwork_width') or 0)]
+artwork = ArtworkResolver(os.path.join(addon_profile, 'artwork.json'), artwork_width)
+
+log_levels = [psvue.LOG_ERROR, psvue.LOG_DEBUG, psvue.LOG_VERBOSE]
+log_level = log_levels[int(addon.getSetting('log_level') or 0)]
+log_body_limit = int(addon.getSetting('log_body_limit') or 0)
+timeout = (int(addon.getSetting('connect_timeout') or 5), int(addon.getSetting('read_timeout') or 30))
+max_retries = int(addon.getSetting('max_retries') or 0)
+renewal_window = int(addon.getSetting('renewal_window') or 0) * 60
+
+# the modules that only some actions or settings need are imported where they're used to keep startup fast
+vue = None
+vue_in_service = False
+if addon.getSetting('use_service') == 'true':
+    from resources.lib.remote import VueClient, TOKEN_FILE, read_token
+    token = read_token(os.path.join(addon_profile, TOKEN_FILE))
+    if token:
+        vue = VueClient(int(addon.getSetting('service_port')), token, log_level=log_level,
+                        log_body_limit=log_body_limit)
+        vue_in_service = vue.is_running()
+        if not vue_in_service:
+            vue = None  # fall back to running the session in this process
+if not vue:
+    vue = psvue(addon_profile, verify_ssl=verify_ssl, log_level=log_level, log_body_limit=log_body_limit,
+                timeout=timeout, max_retries=max_retries, username=username, password=password,
+                renewal_window=renewal_window)
+
+if addon.getSetting('preferred_bitrate') == '3':  # auto
+    from resources.lib.throughput import ThroughputEstimator
+    throughput = ThroughputEstimator(os.path.join(addon_profile, 'throughput.json'),
+                                     xbmc.getInfoLabel('Network.GatewayAddress') or 'default')
+else:
+    throughput = None
+throughput_headroom = 0.75  # share of the estimated throughput the selected bitrate may use
+samples_since = invocation_started  # requests started before this are already in the throughput estimate
 
 
 def addon_log(string):
@@ -45,6 +88,20 @@ def addon_log(string):
     xbmc.log(msg=msg, level=xbmc.LOGDEBUG)
 
 
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to phase_timings[phase] if timing_phases is on.
+    Phases may nest, e.g. listitems is part of router."""
+    if not timing_phases:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        phase_timings[phase] = phase_timings.get(phase, 0) + time.time() - started
+
+
 def get_user_input(heading):
     keyboard = xbmc.Keyboard('', heading)
     keyboard.doModal()
@@ -70,45 +127,76 @@ def get_numeric_input(heading):
         return None
 
 
-def ask_bitrate(bitrates):
-    """Presents a dialog for user to select from a list of bitrates.
-    Returns the value of the selected bitrate."""
+def ask_bitrate(variants):
+    """Presents a dialog for user to select from a list of variant streams.
+    Returns the selected variant."""
     options = []
-    for bitrate in bitrates:
-        options.append(bitrate + ' Kbps')
+    for variant in variants:
+        if variant['resolution']:
+            options.append('%s Kbps (%s)' % (variant['bitrate'], variant['resolution']))
+        else:
+            options.append('%s Kbps' % variant['bitrate'])
     selected_bitrate = dialog('select', language(30010), options=options)
     if selected_bitrate is not None:
-        return bitrates[selected_bitrate]
+        return variants[selected_bitrate]
     else:
         return None
 
 
-def select_bitrate(manifest_bitrates=None):
-    """Returns a bitrate while honoring the user's preference."""
+def select_bitrate(variants):
+    """Returns a variant stream while honoring the user's preference.
+    variants is sorted from the highest to the lowest bitrate."""
     bitrate_setting = int(addon.getSetting('preferred_bitrate'))
     if bitrate_setting == 0:
         preferred_bitrate = 'highest'
     elif bitrate_setting == 1:
         preferred_bitrate = 'limit'
+    elif bitrate_setting == 3:
+        preferred_bitrate = 'auto'
     else:
         preferred_bitrate = 'ask'
 
-    manifest_bitrates.sort(key=int, reverse=True)
+    if not variants:
+        addon_log('No variant streams found in the manifest.')
+        return None
     if preferred_bitrate == 'highest':
-        return manifest_bitrates[0]
+        return variants[0]
     elif preferred_bitrate == 'limit':
-        allowed_bitrates = []
         max_bitrate_allowed = int(addon.getSetting('max_bitrate_allowed'))
-        for bitrate in manifest_bitrates:
-            if max_bitrate_allowed >= int(bitrate):
-                allowed_bitrates.append(str(bitrate))
-        if allowed_bitrates:
-            return allowed_bitrates[0]
-        else:
-            addon_log('No bitrate in stream matched the maximum bitrate allowed.')
-            return None
+        for variant in variants:
+            if max_bitrate_allowed >= variant['bitrate']:
+                return variant
+        addon_log('No bitrate in stream matched the maximum bitrate allowed.')
+        return None
+    elif preferred_bitrate == 'auto':
+        return auto_bitrate(variants)
     else:
-        return ask_bitrate(manifest_bitrates)
+        return ask_bitrate(variants)
+
+
+def add_request_samples():
+    """Add the responses downloaded since the last call to the throughput estimate."""
+    global samples_since
+    records = vue.get_request_records(samples_since)
+    samples_since = time.time()
+    for record in records:
+        if record['status'] == 200 and record['cache'] != 'hit':
+            throughput.add_sample(record['bytes'], record['latency'])
+
+
+def auto_bitrate(variants):
+    """Return the highest bitrate variant that fits the measured throughput of the current network.
+    The first segment of the candidate is downloaded to measure it if the probe setting is on
+    or the network hasn't been measured yet."""
+    add_request_samples()
+    variant = throughput.pick(variants, throughput_headroom) or variants[0]
+    if addon.getSetting('probe_segment') == 'true' or throughput.estimate() is None:
+        probe = vue.probe_throughput(variant['url'])
+        if probe and throughput.add_sample(*probe):
+            variant = throughput.pick(variants, throughput_headroom)
+    throughput.save()
+    addon_log('Estimated throughput: %s Kbps, selected bitrate: %s Kbps' % (throughput.estimate(), variant['bitrate']))
+    return variant
 
 
 def dialog(dialog_type, heading, message=None, options=None, nolabel=None, yeslabel=None):
@@ -205,6 +293,14 @@ def select_profile():
     else:
         return True
 
+def format_time(datetime_obj):
+    """Return the time of a datetime object in the user's preferred notation."""
+    if addon.getSetting('time_notation') == '0':
+        return datetime_obj.strftime('%I:%M %p')  # 12 hour clock
+    else:
+        return datetime_obj.strftime('%H:%M')
+
+
 def list_search():
     title = language(30021)
     params = {'action': 'search'}
@@ -234,6 +330,7 @@ def list_categories():
         add_item(title, params)
 
     list_search()
+    add_item(language(30039), {'action': 'list_guide'})
     add_item(language(30024), {'action': 'list_all_channels'})
     xbmcplugin.endOfDirectory(_handle)
 
@@ -260,192 +357,190 @@ def list_sortings(type, uri=None, channel_id=None):
 
 def live_on_top(program):
     """List live programs at the top of the listing."""
-    airing_status = []
-    for airing in program['airings']:
-        if airing['badge'] == 'live':
-            return -1
+    if program.live:
+        return -1
     return 1
 
 
-def list_programs(request_method, uri=None, program_id=None, search_query=None, expiration_filter=None):
+def list_next_page(params, offset, items):
+    """Add a 'Next page' item that lists the same content from offset."""
+    params = dict(params, offset=offset)
+    return add_item(language(30030), params, items=items)
+
+
+def list_programs(request_method, uri=None, program_id=None, search_query=None, expiration_filter=None, offset=0):
     items = []
-    programs = vue.get_programs(request_method, uri, program_id, search_query, expiration_filter)
-    if program_id:
-        programs.sort(key=lambda x: x['airing_date'])  # sort detailed listing by date
-        programs.sort(key=live_on_top)
-
-    for program in programs:
-        program_type = program['sentv_type']
-        program_id = program['id']
-        detailed = program['detailed']
-        playable = False
-        info = return_info(program)
-        art = return_art(program)
-        content = None
-
-        if program_type == 'channel':
-            list_title = program['title']
-            params = {
-                'action': 'list_sortings_channel',
-                'type': 'channel',
-                'channel_id': program_id
-            }
+    page_size = int(addon.getSetting('page_size') or 0)
+    next_offset = None
+    if program_id or not page_size:
+        # detailed listings are sorted locally and therefore need every item
+        fetch = lambda: vue.get_programs(request_method, uri, program_id, search_query, expiration_filter)
+    else:
+        pages = vue.iter_programs(request_method, uri, search_query=search_query, page_size=page_size, offset=offset)
+        fetch = lambda: next(pages, [])
+    with timed('fetch'):
+        if search_query and not offset:
+            items_data, server_count = search_programs(search_query, fetch)
         else:
-            title = info['title']
-            content = 'tvshows'
-            try:
-                channel = program['channel']['name']
-            except KeyError:
-                channel = program['airings'][0]['channel_name']
-            channel_colored = coloring(channel, 'channel')
-
-            airing_status = []
-            for airing in program['airings']:
-                status = airing['badge'].replace('_', ' ').upper()
-                status_colored = coloring(status, status)
-                if status_colored not in airing_status:
-                    airing_status.append(status_colored)
-            if coloring('COMING UP', 'COMING UP') in airing_status and len(airing_status) > 1:
-                # hide 'COMING UP' if it's also available as live/vod
-                airing_status.remove(coloring('COMING UP', 'COMING UP'))
-            airing_status = '/'.join(airing_status)
-
-            if detailed:
-                now = datetime.now()
-                now_date = now.date()
-                airing_date_obj = vue.parse_datetime(program['airing_date'], localize=True)
-                airing_date = airing_date_obj.date()
-                if addon.getSetting('time_notation') == '0': # 12 hour clock
-                    airing_time = airing_date_obj.strftime('%I:%M %p')  # 12 hour clock
-                else:
-                    airing_time = airing_date_obj.strftime('%H:%M')
-                if airing_date == now_date:
-                    start_time = coloring(airing_time, 'time')
-                else:
-                    start_time = coloring('%s %s', 'time') % (airing_date_obj.strftime('%Y-%m-%d'), airing_time)
-                list_title = '%s %s %s: %s' % (start_time, airing_status, channel_colored, title)
-            else:
-                list_title = '%s: %s' % (airing_status, title)
-
-            if not detailed:
-                if program['is_favorite']:
-                    expiration_filter = program['favorite_date']  # filter from date program was marked as favorite
-                else:
-                    utcnow = datetime.utcnow()
-                    expiration_filter = utcnow.isoformat()  # filter out items that have expired
+            items_data = fetch()
+            server_count = len(items_data)
+    pageable = not uri or '<offset>' in uri  # as in psvue.iter_programs()
+    if page_size and pageable and not program_id and server_count == page_size:
+        next_offset = offset + page_size
+    with timed('models'):
+        programs = [Program(item, artwork) for item in items_data]
+        del items_data  # free the raw API items before building the list items
+        if program_id:
+            programs.sort(key=lambda x: x.airing_date)  # sort detailed listing by date
+            programs.sort(key=live_on_top)
+
+    with timed('listitems'):
+        for program in programs:
+            program_id = program.id
+            detailed = program.detailed
+            playable = False
+            info = return_info(program)
+            art = return_art(program)
+            content = None
+
+            if program.type == 'channel':
+                list_title = program.title
                 params = {
-                    'action': 'list_programs_detailed',
-                    'request_method': 'get',
-                    'program_id': program_id,
-                    'expiration_filter': expiration_filter
+                    'action': 'list_sortings_channel',
+                    'type': 'channel',
+                    'channel_id': program_id
                 }
-            elif program['playable']:
-                params = {
-                    'action': 'play',
-                    'airings_data': json.dumps(parse_airings(program['airings']))
-                }
-                playable = True
             else:
-                params = {
-                    'action': 'dialog',
-                    'dialog_type': 'ok',
-                    'heading': 'Error',
-                    'message': 'This content is not playable.'
-                }
-
-        items = add_item(list_title, params, playable=playable, set_art=art, set_info=info, set_content=content, items=items)
+                title = info['title']
+                content = 'tvshows'
+                channel_colored = coloring(program.channel_name, 'channel')
+                airing_status = '/'.join([coloring(status, status) for status in program.statuses])
+
+                if detailed:
+                    now = datetime.now()
+                    now_date = now.date()
+                    airing_date_obj = local_airing_date(program)
+                    airing_date = airing_date_obj.date()
+                    airing_time = format_time(airing_date_obj)
+                    if airing_date == now_date:
+                        start_time = coloring(airing_time, 'time')
+                    else:
+                        start_time = coloring('%s %s', 'time') % (airing_date_obj.strftime('%Y-%m-%d'), airing_time)
+                    list_title = '%s %s %s: %s' % (start_time, airing_status, channel_colored, title)
+                else:
+                    list_title = '%s: %s' % (airing_status, title)
+
+                if not detailed:
+                    if program.is_favorite:
+                        expiration_filter = program.favorite_date  # filter from date program was marked as favorite
+                    else:
+                        utcnow = datetime.utcnow()
+                        expiration_filter = utcnow.isoformat()  # filter out items that have expired
+                    params = {
+                        'action': 'list_programs_detailed',
+                        'request_method': 'get',
+                        'program_id': program_id,
+                        'expiration_filter': expiration_filter
+                    }
+                elif program.playable:
+                    params = {
+                        'action': 'play',
+                        'airings_data': json.dumps(parse_airings(program.airings))
+                    }
+                    playable = True
+                else:
+                    params = {
+                        'action': 'dialog',
+                        'dialog_type': 'ok',
+                        'heading': 'Error',
+                        'message': 'This content is not playable.'
+                    }
+
+            items = add_item(list_title, params, playable=playable, set_art=art, set_info=info, set_content=content, items=items)
+
+    if next_offset:
+        params = {'action': 'list_programs', 'request_method': request_method}
+        if uri:
+            params['uri'] = uri
+        else:
+            params['search_query'] = search_query
+        items = list_next_page(params, next_offset, items)
 
     xbmcplugin.addDirectoryItems(_handle, items, len(items))
     xbmcplugin.endOfDirectory(_handle)
+    if any(program.type == 'channel' for program in programs):
+        prewarm_channels()
+
+
+def search_programs(search_query, fetch):
+    """Return the local search index matches merged with the server results from fetch(),
+    along with the number of server results. Only the local matches are used if the server is too slow or fails."""
+    from resources.lib.workers import WorkerPool, ResultTimeout
+    pool = WorkerPool(1)
+    server_results = pool.submit(fetch)
+    pool.shutdown()
+    local_items = vue.search_local(search_query)
+    try:
+        server_items = server_results.result(int(addon.getSetting('search_timeout') or 3))
+    except ResultTimeout:
+        addon_log('Server search timed out, only listing local results.')
+        server_items = []
+    except vue.VueError as error:
+        if error.value in psvue.SESSION_ERRORS:
+            raise  # the session has to be recovered with a new login first
+        addon_log('Server search failed (%s), only listing local results.' % error.value)
+        server_items = []
+    except Exception as error:  # connection errors and timeouts after the retries, or a failed service call
+        addon_log('Server search failed (%s), only listing local results.' % error)
+        server_items = []
 
+    # prefer the fresher server copy of items that are in both
+    items = {}
+    for item in server_items:
+        items[(item['sentv_type'] == 'channel', item['id'])] = item
+    merged = []
+    for item in local_items:
+        merged.append(items.pop((item['sentv_type'] == 'channel', item['id']), item))
+    for item in server_items:
+        if (item['sentv_type'] == 'channel', item['id']) in items:
+            merged.append(item)
 
-def return_info(program):
-    program_type = program['sentv_type']
-    detailed = program['detailed']
-    title = program.get('title')
-    season = program.get('season_num')
-    episode = program.get('episode_num')
-    plot = program.get('synopsis')
-    genres = []
-    for genre in program['genres']:
-        genres.append(genre['genre'])
-    genre = ', '.join(genres)
-
-    if program_type != 'Movies':
-        tvshowtitle = program.get('title')
-    else:
-        tvshowtitle = None
+    return merged, len(server_items)
 
-    try:
-        airing_date_obj = vue.parse_datetime(program['airing_date'], localize=True)
-        aired = airing_date_obj.strftime('%Y-%m-%d')
-    except KeyError:
-        aired = None
 
-    if detailed:
-        if program_type != 'Movies':
-            title = program.get('display_episode_title')
-            mediatype = 'episode'
-        else:
-            mediatype = 'movie'
+def local_airing_date(program):
+    return vue.parse_datetime(program.airing_date, localize=True)
+
+
+def return_info(program):
+    if program.airing_date:
+        aired = local_airing_date(program).strftime('%Y-%m-%d')
     else:
-        if program.get('series_synopsis'):
-            plot = program.get('series_synopsis')
-        if program_type == 'Movies':
-            mediatype = 'movie'
-        else:
-            mediatype = 'tvshow'
+        aired = None
 
     info = {
-        'title': title,
-        'tvshowtitle': tvshowtitle,
-        'plot': plot,
-        'season': season,
-        'episode': episode,
-        'genre': genre,
+        'title': program.title,
+        'tvshowtitle': program.tvshowtitle,
+        'plot': program.plot,
+        'season': program.season,
+        'episode': program.episode,
+        'genre': program.genre,
         'aired': aired,
-        'mediatype': mediatype
+        'mediatype': program.mediatype
     }
 
     return info
 
 
 def return_art(program):
-    program_type = program['sentv_type']
-    try:
-        program_images = program['urls']
-        highest_res = 0
-        for image in program_images:
-            image_res = int(image['width'])
-            if image_res > highest_res:
-                program_image = image['src']
-                highest_res = image_res
-    except KeyError:
-        program_image = None
-    except TypeError:
-        program_image = None
-
-    try:
-        channel_images = program['channel']['urls']
-        highest_res = 0
-        for image in channel_images:
-            image_res = int(image['width'])
-            if image_res > highest_res:
-                channel_image = image['src']
-                highest_res = image_res
-    except KeyError:
-        channel_image = None
-    except TypeError:
-        channel_image = None
-
-    if program_type != 'channel':
-        thumb = program_image
-        clearlogo = channel_image
-        fanart = program_image
-        cover = program_image
+    if program.type != 'channel':
+        thumb = program.image
+        clearlogo = program.channel_logo
+        fanart = program.image
+        cover = program.image
     else:
-        thumb = program_image
-        clearlogo = program_image
+        thumb = program.image
+        clearlogo = program.image
         fanart = None
         cover = None
 
@@ -462,11 +557,11 @@ def return_art(program):
 def parse_airings(airings_data):
     airings = []
     for item in airings_data:
-        if item['badge'] != 'coming_up':
+        if item.badge != 'coming_up':
             airing = {
-                'title': '%s (%s)' % (item['channel_name'], coloring(item['badge'].upper(), item['badge'].replace('_', ' ').upper())),
-                'airing_id': item['airing_id'],
-                'channel_id': item['channel_id']
+                'title': '%s (%s)' % (item.channel_name, coloring(item.badge.upper(), item.status)),
+                'airing_id': item.airing_id,
+                'channel_id': item.channel_id
             }
             airings.append(airing)
 
@@ -478,19 +573,27 @@ def play(airings_data):
     if len(airings_json) == 1:
         stream_url = vue.get_stream_url(airings_json[0]['airing_id'])
     else:
+        # resolve all versions while the user is choosing so the selected one plays right away
+        streams = vue.resolve_streams([airing['airing_id'] for airing in airings_json])
         versions = []
         for airing in airings_json:
             versions.append(airing['title'])
         selected_version = dialog('select', language(30023), options=versions)
         if selected_version is not None:
-            stream_url = vue.get_stream_url(airings_json[selected_version]['airing_id'])
+            selected_stream = streams.pop(airings_json[selected_version]['airing_id'])
+        else:
+            selected_stream = None
+        for stream in streams.values():
+            stream.cancel()
+        if selected_stream:
+            stream_url = selected_stream.result()
         else:
             return False
 
     if stream_url:
-        bitrate = select_bitrate(stream_url['bitrates'].keys())
-        if bitrate:
-            play_url = stream_url['bitrates'][bitrate]
+        variant = select_bitrate(stream_url['variants'])
+        if variant:
+            play_url = variant['url']
             playitem = xbmcgui.ListItem(path=play_url)
             playitem.setProperty('IsPlayable', 'true')
             xbmcplugin.setResolvedUrl(_handle, True, listitem=playitem)
@@ -499,25 +602,88 @@ def play(airings_data):
 def play_channel(channel_id):
     stream_url = vue.get_stream_url(channel_id=channel_id)
     if stream_url:
-        bitrate = select_bitrate(stream_url['bitrates'].keys())
-        if bitrate:
-            play_url = stream_url['bitrates'][bitrate]
+        variant = select_bitrate(stream_url['variants'])
+        if variant:
+            play_url = variant['url']
             playitem = xbmcgui.ListItem(path=play_url)
             playitem.setProperty('IsPlayable', 'true')
             xbmcplugin.setResolvedUrl(_handle, True, listitem=playitem)
 
-def list_all_channels():
-    channels = vue.get_programs('get', 'channels/items/all/sort/channeltype/offset/0/size/999')
+def list_all_channels(offset=0):
+    uri = 'channels/items/all/sort/channeltype/offset/<offset>/size/<size>'
+    page_size = int(addon.getSetting('page_size') or 0)
+    if page_size:
+        channels = next(vue.iter_programs('get', uri, page_size=page_size, offset=offset), [])
+    else:
+        channels = vue.get_programs('get', uri)
 
     for channel in channels:
+        channel = Program(channel, artwork)
+        params = {
+            'action': 'play_channel',
+            'channel_id': channel.id
+        }
+        add_item(channel.title, params, set_art=return_art(channel), playable=True)
+    if page_size and len(channels) == page_size:
+        list_next_page({'action': 'list_all_channels'}, offset + page_size, False)
+    xbmcplugin.endOfDirectory(_handle)
+    prewarm_channels()
+
+
+def prewarm_channels():
+    """Resolve the streams of the most watched channels once a channel listing is shown,
+    so that zapping to one of them doesn't have to wait for the stream and manifest requests."""
+    count = int(addon.getSetting('prewarm_channels') or 0)
+    if count:
+        # the service resolves them in the background, a plugin process has to finish them before it exits
+        vue.prewarm_channels(count, wait=not vue_in_service)
+
+
+def list_guide(timestamp=None):
+    """List what's on all channels at timestamp (default now) along with what's up next."""
+    from resources.lib.guide import Guide
+    items = []
+    guide = Guide(vue, os.path.join(addon_profile, 'guide.json'), artwork=artwork)
+    guide.refresh()
+    if timestamp is None:
+        timestamp = time.time()
+
+    for channel, current, upcoming in guide.whats_on(timestamp):
+        list_title = coloring(channel.title, 'channel')
+        plot = []
+        for entry in (current, upcoming):
+            if entry:
+                start_time = format_time(datetime.fromtimestamp(entry.start))
+                list_title = '%s %s %s' % (list_title, coloring(start_time, 'time'), entry.title)
+                plot.append('%s %s' % (start_time, entry.episode_title or entry.title))
+        info = {
+            'title': current.title if current else channel.title,
+            'plot': '[CR]'.join(plot)
+        }
         params = {
             'action': 'play_channel',
-            'channel_id': channel['id']
+            'channel_id': channel.id
         }
-        add_item(channel['title'], params, set_art=return_art(channel), playable=True)
+        art = {'thumb': channel.logo, 'clearlogo': channel.logo}
+        items = add_item(list_title, params, set_art=art, set_info=info, playable=True, items=items)
+
+    items = add_item(language(30040), {'action': 'list_guide', 'time': timestamp + 3600}, items=items)
+    xbmcplugin.addDirectoryItems(_handle, items, len(items))
     xbmcplugin.endOfDirectory(_handle)
 
 
+def export_pvr():
+    """Export the channel playlist and guide for the PVR IPTV Simple Client."""
+    from resources.lib.guide import Guide
+    from resources.lib.export import PVRExporter
+    guide = Guide(vue, os.path.join(addon_profile, 'guide.json'), artwork=artwork)
+    guide.refresh()
+    output_dir = xbmc.translatePath(addon.getSetting('pvr_export_path')) or os.path.join(addon_profile, 'pvr')
+    exporter = PVRExporter(guide, output_dir, os.path.join(addon_profile, 'pvr_state'), _url)
+    exporter.export()
+    dialog('ok', language(30041), language(30042) % output_dir)
+
+
 def router(paramstring):
     """Router function that calls other functions depending on the provided paramstring."""
     params = dict(urlparse.parse_qsl(paramstring))
@@ -527,7 +693,8 @@ def router(paramstring):
         elif params['action'] == 'list_sortings_channel':
             list_sortings(params['type'], channel_id=params['channel_id'])
         elif params['action'] == 'list_programs':
-            list_programs(params['request_method'], params['uri'])
+            list_programs(params['request_method'], params.get('uri'), search_query=params.get('search_query'),
+                          offset=int(params.get('offset', 0)))
         elif params['action'] == 'list_programs_detailed':
             list_programs(params['request_method'], program_id=params['program_id'],
                           expiration_filter=params['expiration_filter'])
@@ -539,24 +706,99 @@ def router(paramstring):
             search()
         elif params['action'] == 'play_channel':
             play_channel(params['channel_id'])
+        elif params['action'] == 'list_guide':
+            if 'time' in params:
+                list_guide(float(params['time']))
+            else:
+                list_guide()
+        elif params['action'] == 'export_pvr':
+            export_pvr()
         elif params['action'] == 'list_all_channels':
-            list_all_channels()
+            list_all_channels(int(params.get('offset', 0)))
     else:
         list_categories()
 
 
-if __name__ == '__main__':
-    if not vue.valid_session:
-        login_process()
+def profiled_router(paramstring, action):
+    """Call the router, under cProfile if the action is listed in the profile_actions setting.
+    The profile is saved to the profiles folder in the add-on profile, keeping the 20 newest."""
+    actions = [x.strip() for x in addon.getSetting('profile_actions').split(',') if x.strip()]
+    if action not in actions and '*' not in actions:
+        return router(paramstring)
 
+    import cProfile
+    profiler = cProfile.Profile()
     try:
-        router(sys.argv[2][1:])  # trim the leading '?' from the plugin call paramstring
-    except vue.VueError as error:
-        if error.value == 'The user\'s geo-location has changed.':
-            login_process()
-            router(sys.argv[2][1:])
-        elif error.value == 'There is a problem with your access.  Please close the application and then sign in again to ensure that your most recent information is used to access your subscription service.   (Error 1007)':
-            login_process()
-            router(sys.argv[2][1:])
-        else:
-            dialog('ok', 'Error', error.value)
+        return profiler.runcall(router, paramstring)
+    finally:
+        profile_dir = os.path.join(addon_profile, 'profiles')
+        if not os.path.exists(profile_dir):
+            os.makedirs(profile_dir)
+        profile_file = os.path.join(profile_dir, '%s-%s.prof' % (action, int(time.time() * 1000)))
+        profiler.dump_stats(profile_file)
+        addon_log('Profile saved to: %s' % profile_file)
+        profile_files = sorted((os.path.join(profile_dir, x) for x in os.listdir(profile_dir)), key=os.path.getmtime)
+        for old_profile_file in profile_files[:-20]:
+            os.remove(old_profile_file)
+
+
+def log_invocation_stats(action, stats_before, record_stats=False):
+    """Log a machine-readable summary of this invocation so performance can be compared between versions.
+    With record_stats the summary is also appended to stats.log in the add-on profile, along with the
+    timings of every request."""
+    summary = {
+        'action': action,
+        'started': round(invocation_started, 3),
+        'wall_time': round(time.time() - invocation_started, 3),
+        'phases': dict((phase, round(seconds, 4)) for phase, seconds in phase_timings.items())
+    }
+    for key, value in vue.get_stats().items():
+        summary[key] = round(value - stats_before.get(key, 0), 4)
+    if log_level >= psvue.LOG_DEBUG:
+        addon_log('Invocation stats: %s' % json.dumps(summary, sort_keys=True))
+    if record_stats:
+        # the service keeps the records of every client, so drop the ones from before this invocation
+        summary['request_records'] = [record for record in vue.pop_request_records()
+                                      if record['started'] >= summary['started']]
+        append_rolling(os.path.join(addon_profile, 'stats.log'), json.dumps(summary, sort_keys=True))
+
+
+if __name__ == '__main__':
+    paramstring = sys.argv[2][1:]  # trim the leading '?' from the plugin call paramstring
+    action = dict(urlparse.parse_qsl(paramstring)).get('action') or 'list_categories'
+    phase_timings['startup'] = time.time() - invocation_started
+    record_stats = addon.getSetting('record_stats') == 'true'
+    if record_stats or log_level >= psvue.LOG_DEBUG:
+        stats_before = vue.get_stats()
+        timing_phases = True
+    else:
+        stats_before = None
+    renewal = None
+    try:
+        if action != 'dialog':
+            with timed('session'):
+                if not vue.valid_session:
+                    login_process()
+                elif not vue_in_service:  # the service renews its session on its own
+                    renewal = vue.renew_session_in_background()
+
+        try:
+            with timed('router'):
+                profiled_router(paramstring, action)
+        except vue.VueError as error:
+            if error.value in psvue.SESSION_ERRORS:
+                # psvue already tried to recover the failed request, so start over with a full login
+                login_process()
+                profiled_router(paramstring, action)
+            else:
+                dialog('ok', 'Error', error.value)
+    finally:
+        if renewal:
+            renewal.result()  # let the renewal finish before the credentials and cookies are written
+        vue.flush()
+        artwork.save()
+        if throughput:
+            add_request_samples()
+            throughput.save()
+        if stats_before is not None:
+            log_invocation_stats(action, stats_before, record_stats)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Pick artwork from the PlayStation Vue image sets and remember the channel logos
+"""
+import json
+
+from .utils import atomic_write
+
+CACHE_VERSION = 2  # logos are keyed by image set and channel ID since version 2
+
+
+class ArtworkResolver(object):
+    """Choose one image per image set, caching the result for channel logos by image set and channel ID.
+    With a target_width the smallest image at least that wide is used, otherwise the widest one.
+    The cache file is only read once a channel logo is needed."""
+
+    def __init__(self, cache_file=None, target_width=0):
+        self.cache_file = cache_file
+        self.target_width = target_width
+        self.dirty = False
+        self._channel_logos = None
+
+    @property
+    def channel_logos(self):
+        if self._channel_logos is None:
+            self._channel_logos = {}
+            if self.cache_file:
+                try:
+                    with open(self.cache_file, 'r') as fh_cache:
+                        cache = json.loads(fh_cache.read())
+                    if cache.get('version') == CACHE_VERSION and cache.get('target_width') == self.target_width:
+                        self._channel_logos = cache['channel_logos']
+                except (IOError, ValueError, KeyError):
+                    pass
+        return self._channel_logos
+
+    def select(self, images):
+        """Return the src of the best image in a list of API image dicts, or None."""
+        widest = None
+        widest_res = 0
+        fitting = None
+        fitting_res = 0
+        try:
+            for image in images:
+                image_res = int(image['width'])
+                if image_res > widest_res:
+                    widest = image['src']
+                    widest_res = image_res
+                if self.target_width and self.target_width <= image_res and (not fitting or image_res < fitting_res):
+                    fitting = image['src']
+                    fitting_res = image_res
+        except (KeyError, TypeError, ValueError):
+            pass
+        return fitting or widest
+
+    def channel_logo(self, channel_id, images, image_set='channel'):
+        """Return the logo for a channel, only looking at its images the first time the channel is seen.
+        image_set names where the images come from, as a channel has different images in different places:
+        'item' for the urls of a channel item itself, 'channel' for the channel dict of a program."""
+        if not channel_id:
+            return self.select(images)
+        key = '%s/%s' % (image_set, channel_id)
+        try:
+            return self.channel_logos[key]
+        except KeyError:
+            logo = self.select(images)
+            if logo:
+                self.channel_logos[key] = logo
+                self.dirty = True
+            return logo
+
+    def save(self):
+        """Write the channel logo cache to file if it changed."""
+        if self.cache_file and self.dirty:
+            cache = {
+                'version': CACHE_VERSION,
+                'target_width': self.target_width,
+                'channel_logos': self.channel_logos
+            }
+            atomic_write(self.cache_file, json.dumps(cache))
+            self.dirty = False
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+A persistent HTTP response cache for the PlayStation Vue catalog endpoints
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib import urlencode
+
+from .utils import atomic_write
+
+
+class ResponseCache(object):
+    """Store GET responses on disk with a TTL, conditional revalidation and LRU eviction.
+    Access times are only updated in memory on a hit; flush() writes them."""
+
+    def __init__(self, path, max_size=20 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.index_file = os.path.join(self.path, 'index.json')
+        self.lock = threading.RLock()
+        self._index = None
+        self.dirty = False  # access times changed since the index was written
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                with open(self.index_file, 'r') as fh_index:
+                    self._index = json.loads(fh_index.read())
+            except (IOError, ValueError):
+                self._index = {}
+        return self._index
+
+    def make_key(self, url, params=None):
+        """Return the cache key for an URL and its query parameters."""
+        if params:
+            url = url + '?' + urlencode(sorted(params.items()))
+        return hashlib.sha1(url).hexdigest()
+
+    def get(self, key):
+        """Return the cache entry for key along with its content, or None if it's not cached."""
+        with self.lock:
+            entry = self.index.get(key)
+            if not entry:
+                return None
+            try:
+                with open(os.path.join(self.path, key), 'rb') as fh_content:
+                    content = fh_content.read()
+            except IOError:
+                self.remove(key)
+                return None
+            entry['accessed'] = time.time()
+            self.dirty = True
+            return dict(entry, content=content)
+
+    def is_fresh(self, entry):
+        """Return whether the entry can be used without contacting the server."""
+        return time.time() < entry['stored'] + entry['ttl']
+
+    def validators(self, entry):
+        """Return the conditional request headers for a stale entry."""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, content, headers, ttl):
+        """Save a response and evict the least recently used entries if the cache grows too large."""
+        with self.lock:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            atomic_write(os.path.join(self.path, key), content)
+            now = time.time()
+            self.index[key] = {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'stored': now,
+                'accessed': now,
+                'ttl': ttl,
+                'size': len(content)
+            }
+            self.evict()
+            self.save_index()
+
+    def revalidated(self, key, ttl):
+        """Mark an entry as fresh again after the server answered 304 Not Modified."""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry:
+                entry['stored'] = time.time()
+                entry['ttl'] = ttl
+                self.save_index()
+
+    def remove(self, key):
+        with self.lock:
+            self.index.pop(key, None)
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+            self.save_index()
+
+    def evict(self):
+        """Drop the least recently used entries until the cache fits within max_size."""
+        total_size = sum(entry['size'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda x: self.index[x]['accessed']):
+            if total_size <= self.max_size:
+                break
+            total_size -= self.index.pop(key)['size']
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+
+    def save_index(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                atomic_write(self.index_file, json.dumps(self._index))
+            self.dirty = False
+
+    def flush(self):
+        """Write the index if access times changed since it was last written."""
+        if self.dirty:
+            self.save_index()
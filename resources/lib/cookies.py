@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+A cookie jar that only hits the disk when its contents changed
+"""
+import cookielib
+
+from .utils import atomic_write
+
+
+class PersistentCookieJar(cookielib.LWPCookieJar):
+    """LWPCookieJar that tracks changes, indexes cookies by name and saves atomically."""
+
+    def __init__(self, filename=None, delayload=False, policy=None):
+        cookielib.LWPCookieJar.__init__(self, filename, delayload, policy)
+        self.dirty = False
+        self.name_index = {}
+
+    def set_cookie(self, cookie):
+        self._cookies_lock.acquire()
+        try:
+            try:
+                existing = self._cookies[cookie.domain][cookie.path][cookie.name]
+                unchanged = existing.value == cookie.value and existing.expires == cookie.expires
+            except KeyError:
+                unchanged = False
+            cookielib.LWPCookieJar.set_cookie(self, cookie)
+            self.name_index[cookie.name] = cookie
+            if not unchanged:
+                self.dirty = True
+        finally:
+            self._cookies_lock.release()
+
+    def clear(self, domain=None, path=None, name=None):
+        self._cookies_lock.acquire()
+        try:
+            cookielib.LWPCookieJar.clear(self, domain, path, name)
+            self.name_index = {}
+            for cookie in self:
+                self.name_index[cookie.name] = cookie
+            self.dirty = True
+        finally:
+            self._cookies_lock.release()
+
+    def get_by_name(self, name):
+        """Return the cookie with the given name, or None if there's no such cookie."""
+        return self.name_index.get(name)
+
+    def load(self, filename=None, ignore_discard=False, ignore_expires=False):
+        cookielib.LWPCookieJar.load(self, filename, ignore_discard, ignore_expires)
+        self.dirty = False
+
+    def save(self, filename=None, ignore_discard=False, ignore_expires=False):
+        """Write the cookies to file if they changed (or expired) since they were last loaded or saved."""
+        if filename is None:
+            filename = self.filename
+        self._cookies_lock.acquire()
+        try:
+            if not ignore_expires:
+                self.clear_expired_cookies()
+            if not self.dirty:
+                return
+            data = '#LWP-Cookies-2.0\n' + self.as_lwp_str(ignore_discard, ignore_expires)
+            atomic_write(filename, data)
+            self.dirty = False
+        finally:
+            self._cookies_lock.release()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Export the PlayStation Vue channels and guide as an M3U playlist and an XMLTV file
+for the PVR IPTV Simple Client
+"""
+import os
+import json
+import shutil
+import hashlib
+import time
+from urllib import urlencode
+from xml.sax.saxutils import escape, quoteattr
+
+from .utils import atomic_open, atomic_write
+
+
+def encode(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return str(text)
+
+
+def xmltv_time(timestamp):
+    return time.strftime('%Y%m%d%H%M%S +0000', time.gmtime(timestamp))
+
+
+class PVRExporter(object):
+    """Write playlist.m3u and guide.xml to output_dir from a Guide.
+    The programmes of each channel are kept as a fragment in state_dir and only rewritten when
+    that channel's airings changed; guide.xml is then streamed together from the fragments."""
+
+    def __init__(self, guide, output_dir, state_dir, plugin_url):
+        self.guide = guide
+        self.output_dir = output_dir
+        self.state_dir = state_dir
+        self.plugin_url = plugin_url
+        self.fragments_dir = os.path.join(self.state_dir, 'programmes')
+        self.state_file = os.path.join(self.state_dir, 'state.json')
+
+    def export(self):
+        """Write both files. Return the number of channels whose programmes were regenerated."""
+        for path in (self.output_dir, self.fragments_dir):
+            if not os.path.exists(path):
+                os.makedirs(path)
+        self.write(os.path.join(self.output_dir, 'playlist.m3u'), self.m3u_lines())
+        regenerated = self.update_fragments()
+        self.write(os.path.join(self.output_dir, 'guide.xml'), self.xmltv_lines(), self.fragment_files())
+        return regenerated
+
+    def write(self, path, lines, fragment_files=()):
+        with atomic_open(path) as fh_output:
+            for line in lines:
+                if line is None:  # marks where the programme fragments go
+                    for fragment_file in fragment_files:
+                        with open(fragment_file, 'rb') as fh_fragment:
+                            shutil.copyfileobj(fh_fragment, fh_output)
+                else:
+                    fh_output.write(line)
+
+    def m3u_lines(self):
+        yield '#EXTM3U\n'
+        for channel in self.guide.channels:
+            url = self.plugin_url + '?' + urlencode({'action': 'play_channel', 'channel_id': channel.id})
+            yield '#EXTINF:-1 tvg-id="%s" tvg-name="%s" tvg-logo="%s",%s\n' % (
+                channel.id, encode(channel.title).replace('"', "'"), encode(channel.logo or ''), encode(channel.title))
+            yield url + '\n'
+
+    def xmltv_lines(self):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<tv generator-info-name="plugin.video.psvue">\n'
+        for channel in self.guide.channels:
+            yield '  <channel id=%s>\n' % quoteattr(str(channel.id))
+            yield '    <display-name>%s</display-name>\n' % escape(encode(channel.title))
+            if channel.logo:
+                yield '    <icon src=%s/>\n' % quoteattr(encode(channel.logo))
+            yield '  </channel>\n'
+        yield None
+        yield '</tv>\n'
+
+    def programme_lines(self, channel):
+        channel_id = quoteattr(str(channel.id))
+        for entry in channel.entries:
+            yield '  <programme start="%s" stop="%s" channel=%s>\n' % (
+                xmltv_time(entry.start), xmltv_time(entry.end), channel_id)
+            yield '    <title>%s</title>\n' % escape(encode(entry.title or ''))
+            if entry.episode_title:
+                yield '    <sub-title>%s</sub-title>\n' % escape(encode(entry.episode_title))
+            yield '  </programme>\n'
+
+    def fragment_file(self, channel_id):
+        return os.path.join(self.fragments_dir, '%s.xml' % channel_id)
+
+    def fragment_files(self):
+        for channel in self.guide.channels:
+            yield self.fragment_file(channel.id)
+
+    def digest(self, channel):
+        entries = [[entry.start, entry.end, entry.title, entry.episode_title] for entry in channel.entries]
+        return hashlib.sha1(json.dumps(entries)).hexdigest()
+
+    def update_fragments(self):
+        """Rewrite the programme fragments of the channels that changed since the last export."""
+        try:
+            with open(self.state_file, 'r') as fh_state:
+                digests = json.loads(fh_state.read())
+        except (IOError, ValueError):
+            digests = {}
+
+        regenerated = 0
+        new_digests = {}
+        for channel in self.guide.channels:
+            key = str(channel.id)
+            new_digests[key] = self.digest(channel)
+            if digests.get(key) != new_digests[key] or not os.path.exists(self.fragment_file(channel.id)):
+                self.write(self.fragment_file(channel.id), self.programme_lines(channel))
+                regenerated += 1
+
+        for key in set(digests) - set(new_digests):
+            try:
+                os.remove(self.fragment_file(key))
+            except OSError:
+                pass
+
+        atomic_write(self.state_file, json.dumps(new_digests))
+        return regenerated
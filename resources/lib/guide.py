@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+An electronic program guide for all PlayStation Vue channels
+"""
+import json
+import time
+import calendar
+from bisect import bisect_right
+
+from .models import default_artwork
+from .utils import atomic_write
+
+GUIDE_URI = 'channels/items/all/sort/channeltype/offset/0/size/999'
+
+
+class GuideEntry(object):
+    """One airing in the guide. start and end are UTC unix timestamps."""
+    __slots__ = ('start', 'end', 'title', 'episode_title', 'airing_id')
+
+    def __init__(self, start, end, title, episode_title=None, airing_id=None):
+        self.start = start
+        self.end = end
+        self.title = title
+        self.episode_title = episode_title
+        self.airing_id = airing_id
+
+
+class GuideChannel(object):
+    """A channel with its airings sorted by start time, with the start times in a separate list for bisect."""
+    __slots__ = ('id', 'title', 'logo', 'entries', 'starts')
+
+    def __init__(self, channel_id, title, logo, entries):
+        self.id = channel_id
+        self.title = title
+        self.logo = logo
+        self.entries = sorted(entries, key=lambda x: x.start)
+        self.starts = [entry.start for entry in self.entries]
+
+    def on_at(self, timestamp):
+        """Return the entry airing at timestamp, or None."""
+        index = bisect_right(self.starts, timestamp) - 1
+        if index >= 0 and self.entries[index].end > timestamp:
+            return self.entries[index]
+        return None
+
+    def next_after(self, timestamp):
+        """Return the first entry starting after timestamp, or None."""
+        index = bisect_right(self.starts, timestamp)
+        if index < len(self.entries):
+            return self.entries[index]
+        return None
+
+
+class Guide(object):
+    """Bulk-fetch the airings for all channels and answer now/next queries without further requests.
+    The guide is kept in cache_file and only fetched again once it's older than ttl seconds."""
+
+    def __init__(self, vue, cache_file=None, ttl=1800, artwork=default_artwork):
+        self.vue = vue
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.artwork = artwork
+        self.fetched = 0
+        self.channels = []
+        self.load()
+
+    def load(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, 'r') as fh_guide:
+                guide = json.loads(fh_guide.read())
+            self.fetched = guide['fetched']
+            self.channels = [self._channel_from_dict(channel) for channel in guide['channels']]
+        except (IOError, ValueError, KeyError):
+            self.fetched = 0
+            self.channels = []
+
+    def save(self):
+        if not self.cache_file:
+            return
+        guide = {
+            'fetched': self.fetched,
+            'channels': [self._channel_to_dict(channel) for channel in self.channels]
+        }
+        atomic_write(self.cache_file, json.dumps(guide))
+
+    def is_stale(self):
+        return time.time() - self.fetched > self.ttl
+
+    def refresh(self, force=False):
+        """Fetch the guide from the API if it's stale (or force is set)."""
+        if not force and self.channels and not self.is_stale():
+            return
+        channels = []
+        for item in self.vue.get_programs('get', GUIDE_URI):
+            entries = self._parse_airings(item.get('airings') or [])
+            logo = self.artwork.channel_logo(item['id'], item.get('urls'), 'item')
+            channels.append(GuideChannel(item['id'], item.get('title'), logo, entries))
+        self.channels = channels
+        self.fetched = time.time()
+        self.save()
+
+    def whats_on(self, timestamp=None):
+        """Return a list of (channel, entry airing at timestamp, the entry after it) for all channels.
+        timestamp defaults to now; entries are None where the guide has no data."""
+        if timestamp is None:
+            timestamp = time.time()
+        listing = []
+        for channel in self.channels:
+            current = channel.on_at(timestamp)
+            upcoming = channel.next_after(current.start if current else timestamp)
+            listing.append((channel, current, upcoming))
+        return listing
+
+    def _timestamp(self, iso8601_string):
+        return calendar.timegm(self.vue.parse_datetime(iso8601_string).utctimetuple())
+
+    def _parse_airings(self, airings):
+        """Turn the API airings into GuideEntry objects. Airings without an end time or duration end
+        when the next airing starts."""
+        entries = []
+        for airing in airings:
+            start_date = airing.get('airing_date') or airing.get('start_time')
+            if not start_date:
+                continue
+            start = self._timestamp(start_date)
+            if airing.get('end_time'):
+                end = self._timestamp(airing['end_time'])
+            elif airing.get('duration'):
+                end = start + int(airing['duration'])
+            else:
+                end = None
+            title = airing.get('title') or airing.get('program_title')
+            entries.append(GuideEntry(start, end, title, airing.get('display_episode_title'), airing.get('airing_id')))
+
+        entries.sort(key=lambda x: x.start)
+        for index, entry in enumerate(entries):
+            if entry.end is None:
+                if index + 1 < len(entries):
+                    entry.end = entries[index + 1].start
+                else:
+                    entry.end = entry.start + 1800
+        return entries
+
+    def _channel_to_dict(self, channel):
+        return {
+            'id': channel.id,
+            'title': channel.title,
+            'logo': channel.logo,
+            'entries': [[entry.start, entry.end, entry.title, entry.episode_title, entry.airing_id]
+                        for entry in channel.entries]
+        }
+
+    def _channel_from_dict(self, channel):
+        entries = [GuideEntry(*entry) for entry in channel['entries']]
+        return GuideChannel(channel['id'], channel['title'], channel['logo'], entries)
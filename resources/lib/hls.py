@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+A minimal parser for HLS master playlists
+"""
+import re
+
+STREAM_INF = '#EXT-X-STREAM-INF:'
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(attribute_list):
+    """Return the attributes of an EXT-X-STREAM-INF tag as a dict of strings, without the quotes."""
+    return dict((name, value.strip('"')) for name, value in ATTRIBUTE_PATTERN.findall(attribute_list))
+
+
+def parse_master_playlist(content, manifest_url, url_suffix=''):
+    """Return the variant streams of a master playlist as a list of dicts with bitrate (in Kbps), bandwidth,
+    resolution, codecs and url, sorted from the highest to the lowest bitrate. Relative URIs are resolved against
+    manifest_url and url_suffix is appended to every url, e.g. the Kodi header string.
+    Media playlists, I-frame streams and any other tags are skipped."""
+    base_url = manifest_url[:manifest_url.rfind('/') + 1]
+    variants = []
+    attributes = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(STREAM_INF):
+            attributes = parse_attributes(line[len(STREAM_INF):])
+        elif line[0] != '#' and attributes is not None:
+            if not line.startswith('http'):
+                line = base_url + line
+            bandwidth = int(attributes.get('BANDWIDTH', 0))
+            variants.append({
+                'bitrate': bandwidth / 1000,
+                'bandwidth': bandwidth,
+                'resolution': attributes.get('RESOLUTION'),
+                'codecs': attributes.get('CODECS'),
+                'url': line + url_suffix
+            })
+            attributes = None
+
+    variants.sort(key=lambda x: x['bandwidth'], reverse=True)
+    return variants
+
+
+def first_segment(content, playlist_url):
+    """Return the URL of the first media segment in a media playlist, or None if it has none."""
+    for line in content.splitlines():
+        line = line.strip()
+        if line and line[0] != '#':
+            if line.startswith('http'):
+                return line
+            return playlist_url[:playlist_url.rfind('/') + 1] + line
+    return None
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Compact representations of the programs and airings returned by the PlayStation Vue API
+"""
+from .artwork import ArtworkResolver
+
+default_artwork = ArtworkResolver()  # widest images, no persistent cache
+
+
+class Airing(object):
+    """One airing of a program on a channel."""
+    __slots__ = ('airing_id', 'channel_id', 'channel_name', 'badge', 'status')
+
+    def __init__(self, item):
+        self.airing_id = item.get('airing_id')
+        self.channel_id = item.get('channel_id')
+        self.channel_name = item.get('channel_name')
+        self.badge = item.get('badge') or ''
+        self.status = self.badge.replace('_', ' ').upper()  # e.g. 'LIVE', 'COMING UP'
+
+
+class Program(object):
+    """A program or channel item with the fields the listings need, derived once from the API item.
+    Images are picked by the supplied ArtworkResolver, which caches channel logos by channel ID."""
+    __slots__ = ('id', 'type', 'title', 'tvshowtitle', 'season', 'episode', 'plot', 'genre', 'airing_date',
+                 'detailed', 'playable', 'is_favorite', 'favorite_date', 'mediatype', 'channel_name', 'image',
+                 'channel_logo', 'airings', 'statuses', 'live')
+
+    def __init__(self, item, artwork=default_artwork):
+        self.id = item['id']
+        self.type = item['sentv_type']
+        self.detailed = item.get('detailed', False)
+        self.playable = item.get('playable', False)
+        self.is_favorite = item.get('is_favorite', False)
+        self.favorite_date = item.get('favorite_date')
+        self.airing_date = item.get('airing_date')
+        self.season = item.get('season_num')
+        self.episode = item.get('episode_num')
+        self.genre = ', '.join([genre['genre'] for genre in item.get('genres') or []])
+        channel = item.get('channel') or {}
+        if self.type == 'channel':
+            self.image = artwork.channel_logo(self.id, item.get('urls'), 'item')
+        else:
+            self.image = artwork.select(item.get('urls'))
+        self.channel_logo = artwork.channel_logo(channel.get('channel_id') or channel.get('id'), channel.get('urls'))
+        self.airings = [Airing(airing) for airing in item.get('airings') or []]
+
+        movie = self.type == 'Movies'
+        self.tvshowtitle = item.get('title') if not movie else None
+        self.plot = item.get('synopsis')
+        if self.detailed:
+            self.title = item.get('display_episode_title') if not movie else item.get('title')
+            self.mediatype = 'movie' if movie else 'episode'
+        else:
+            self.title = item.get('title')
+            self.mediatype = 'movie' if movie else 'tvshow'
+            if item.get('series_synopsis'):
+                self.plot = item['series_synopsis']
+
+        if channel.get('name'):
+            self.channel_name = channel['name']
+        elif self.airings:
+            self.channel_name = self.airings[0].channel_name
+        else:
+            self.channel_name = None
+
+        statuses = []
+        for airing in self.airings:
+            if airing.status not in statuses:
+                statuses.append(airing.status)
+        if 'COMING UP' in statuses and len(statuses) > 1:
+            # hide 'COMING UP' if it's also available as live/vod
+            statuses.remove('COMING UP')
+        self.statuses = statuses
+        self.live = any(airing.badge == 'live' for airing in self.airings)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Remember which channels are watched most and keep their streams resolved ahead of time
+"""
+import re
+import json
+import time
+import threading
+
+from .utils import atomic_write
+
+TOKEN_EXPIRY_PATTERN = re.compile(r'\b(?:exp|expires)=(\d{10})\b')
+
+
+def token_expiry(stream_url):
+    """Return the earliest expiry timestamp of the tokens in the manifest and variant URLs of a stream,
+    or None if they don't carry one."""
+    urls = [stream_url['manifest']] + [variant['url'] for variant in stream_url['variants']]
+    expiries = [int(match) for url in urls for match in TOKEN_EXPIRY_PATTERN.findall(url)]
+    if expiries:
+        return min(expiries)
+    return None
+
+
+class WatchHistory(object):
+    """How often each channel is watched. Every play adds 1 to the channel's score and scores halve
+    every half_life seconds, so recent habits count most."""
+
+    def __init__(self, history_file, half_life=14 * 24 * 3600):
+        self.history_file = history_file
+        self.half_life = half_life
+        self.lock = threading.Lock()
+        try:
+            with open(self.history_file, 'r') as fh_history:
+                self.channels = json.loads(fh_history.read())
+        except (IOError, ValueError):
+            self.channels = {}
+
+    def score(self, channel_id, now=None):
+        entry = self.channels.get(str(channel_id))
+        if not entry:
+            return 0
+        if now is None:
+            now = time.time()
+        return entry['score'] * 0.5 ** ((now - entry['updated']) / float(self.half_life))
+
+    def record(self, channel_id):
+        with self.lock:
+            now = time.time()
+            self.channels[str(channel_id)] = {'score': self.score(channel_id, now) + 1, 'updated': now}
+            atomic_write(self.history_file, json.dumps(self.channels))
+
+    def top(self, count):
+        """Return the IDs of the count most watched channels, most watched first."""
+        with self.lock:
+            now = time.time()
+            scores = [(self.score(channel_id, now), channel_id) for channel_id in self.channels]
+        scores.sort(reverse=True)
+        return [channel_id for score, channel_id in scores[:count]]
+
+
+class StreamCache(object):
+    """Resolved streams (as returned by psvue.get_stream_url()) per channel, kept in cache_file until
+    margin seconds before their tokens expire, or for ttl seconds if the URLs carry no expiry."""
+
+    def __init__(self, cache_file, ttl=300, margin=60):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.margin = margin
+        self.lock = threading.Lock()
+        try:
+            with open(self.cache_file, 'r') as fh_cache:
+                self.streams = json.loads(fh_cache.read())
+        except (IOError, ValueError):
+            self.streams = {}
+
+    def get(self, channel_id):
+        """Return the cached stream of a channel, or None if there's none that's still valid."""
+        with self.lock:
+            entry = self.streams.get(str(channel_id))
+        if entry and entry['expires'] > time.time():
+            return entry['stream_url']
+        return None
+
+    def store(self, channel_id, stream_url):
+        expires = token_expiry(stream_url)
+        if expires is None:
+            expires = time.time() + self.ttl
+        with self.lock:
+            now = time.time()
+            for key in [key for key, entry in self.streams.items() if entry['expires'] <= now]:
+                del self.streams[key]
+            self.streams[str(channel_id)] = {'stream_url': stream_url, 'expires': expires - self.margin}
+            atomic_write(self.cache_file, json.dumps(self.streams))
+
@@ -5,36 +5,241 @@ A Kodi-agnostic library for PlayStation Vue
 import os
 import json
 import codecs
-import cookielib
 import time
 import calendar
 import uuid
-from datetime import datetime, timedelta
+import threading
+import random
+from collections import deque
+from datetime import datetime, timedelta, tzinfo
 from urllib import urlencode
+from urlparse import parse_qsl
 
-import requests
-import m3u8
-import iso8601
+from .cache import ResponseCache
+from .hls import parse_master_playlist, first_segment
+from .utils import atomic_write
+from .workers import WorkerPool, SingleFlight
+
+MAX_PARSED_DATETIMES = 4096
+MAX_REQUEST_RECORDS = 500  # per-request timings kept until pop_request_records() is called
+_parsed_datetimes = {}  # memo for psvue.parse_datetime(), cleared when it grows past MAX_PARSED_DATETIMES
+_utc_offsets = {}  # the local UTC offset for each UTC quarter hour that has been converted
+
+
+class UTC(tzinfo):
+    """The UTC time zone for datetime objects parsed by parse_api_datetime()."""
+
+    def utcoffset(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def dst(self, dt):
+        return timedelta(0)
+
+
+utc = UTC()
+
+
+def parse_api_datetime(string):
+    """Parse the 'YYYY-MM-DDTHH:MM:SS[.fff]Z' format returned by the API. Return None for any other format."""
+    if len(string) < 20 or string[-1] != 'Z' or string[4] != '-' or string[7] != '-' or string[10] != 'T' \
+            or string[13] != ':' or string[16] != ':':
+        return None
+    try:
+        microsecond = 0
+        if len(string) > 20:
+            if string[19] != '.':
+                return None
+            microsecond = int((string[20:-1] + '000000')[:6])
+        return datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]), int(string[11:13]),
+                        int(string[14:16]), int(string[17:19]), microsecond, utc)
+    except ValueError:
+        return None
+
+
+class VueResponse(object):
+    """An HTTP response whose JSON content is decoded at most once."""
+    __slots__ = ('status_code', 'headers', 'content', 'from_cache', 'cookies', '_json')
+
+    def __init__(self, status_code, headers, content, from_cache=False, cookies=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        self.cookies = cookies or {}  # the cookies set by this response, by name
+        self._json = False  # not decoded yet
+
+    @property
+    def json(self):
+        """The decoded JSON content, or None if the response isn't JSON."""
+        if self._json is False:
+            try:
+                self._json = json.loads(self.content)
+            except ValueError:
+                self._json = None
+        return self._json
+
+    @property
+    def header(self):
+        try:
+            return self.json['header']
+        except (KeyError, TypeError):
+            return {}
+
+    @property
+    def body(self):
+        try:
+            return self.json['body']
+        except (KeyError, TypeError):
+            return {}
+
+    @property
+    def error(self):
+        """The PS Vue API error message, or None if the request was successful."""
+        try:
+            if self.header['error']:
+                return self.header['error']['message']
+        except (KeyError, TypeError):
+            pass
+        return None
 
 
 class psvue(object):
-    def __init__(self, save_path, debug=False, verify_ssl=True):
+    LOG_NONE = 0
+    LOG_ERROR = 1
+    LOG_INFO = 2
+    LOG_DEBUG = 3
+    LOG_VERBOSE = 4  # also logs response bodies and headers
+
+    RETRY_STATUS_CODES = (500, 502, 503, 504)
+    # API errors that mean the session has to be authenticated again, see recover_session()
+    SESSION_ERRORS = (
+        'The user\'s geo-location has changed.',
+        'There is a problem with your access.  Please close the application and then sign in again to ensure that your most recent information is used to access your subscription service.   (Error 1007)'
+    )
+
+    def __init__(self, save_path, debug=False, verify_ssl=True, log_level=None, log_body_limit=2048, timeout=(5, 30),
+                 max_retries=2, username=None, password=None, renewal_window=3600):
         self.save_path = save_path
         self.debug = debug
+        if log_level is None:
+            log_level = self.LOG_DEBUG if debug else self.LOG_NONE
+        self.log_level = log_level
+        self.log_body_limit = log_body_limit  # bytes, 0 means no limit
         self.app_version = '2_6_3'
         self.base_url = 'https://sonyios.secure.footprint.net/%s/pad/' % self.app_version
         self.verify_ssl = verify_ssl
-        self.http_session = requests.Session()
+        self.timeout = timeout  # (connect, read) in seconds
+        self.max_retries = max_retries  # for idempotent GET requests
+        self.retry_backoff = 0.5  # seconds, doubled for every retry and jittered
+        self.default_pool_size = 8  # connections kept alive per host, e.g. the EPG hosts from the config
+        self.pool_sizes = {
+            'https://auth.api.sonyentertainmentnetwork.com': 2,
+            'https://sentv-user-auth.totsuko.tv': 2,
+            'https://media-framework.totsuko.tv': 4,
+            'https://sonyios.secure.footprint.net': 4
+        }
         self.cookie_file = os.path.join(self.save_path, 'cookies')
         self.credentials_file = os.path.join(self.save_path, 'credentials')
-        self.cookie_jar = cookielib.LWPCookieJar(self.cookie_file)
-        try:
-            self.cookie_jar.load(ignore_discard=True, ignore_expires=True)
-        except IOError:
-            pass
-        self.http_session.cookies = self.cookie_jar
-        self.valid_session = self.is_session_valid()
-        self.config = self.get_config()
+        # the HTTP session, cookies, credentials and config are set up on first use
+        # so that actions that don't need them don't pay for them
+        self.lazy_lock = threading.RLock()
+        self._http_session = None
+        self._cookie_jar = None
+        self._credentials = None
+        self._config = None
+        self._search_index = None
+        self._watch_history = None
+        self._stream_cache = None
+        self.index_lock = threading.Lock()
+        self.index_queue = []  # listed items waiting to be added to the search index on flush()
+        self.single_flight = SingleFlight()
+        self.recovery_local = threading.local()  # marks the thread that is recovering the session
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,  # sent upstream, including revalidations
+            'cache_hits': 0,  # answered from the response cache without a request
+            'revalidated': 0,  # answered from the response cache after a 304
+            'bytes_received': 0,
+            'recoveries': 0,  # session errors that were recovered from, see recover_session()
+            'recovery_logins': 0,  # recoveries that needed a password login
+            'recovery_failures': 0,
+            'recovery_time': 0  # seconds spent recovering
+        }
+        self.request_records = deque(maxlen=MAX_REQUEST_RECORDS)
+        self.cache = ResponseCache(os.path.join(self.save_path, 'cache'))
+        self.cache_ttls = [  # the first matching URL fragment decides the TTL in seconds, 0 disables caching
+            ('configuration.json', 0),  # stored separately by download_config()
+            ('menu.json', 12 * 3600),
+            (self.base_url, 6 * 3600)  # channel config and category sortings
+        ]
+        self.profile_data_ttl = 3600  # seconds before the favorites sent with post requests are refreshed
+        self.username = username  # used to renew the session if the grant code is rejected
+        self.password = password
+        self.renewal_window = renewal_window  # seconds before the session expires that it's renewed, 0 disables
+        self.renewal_retry_delay = 600  # seconds between failed renewals
+
+    @property
+    def http_session(self):
+        with self.lazy_lock:
+            if self._http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self._http_session = requests.Session()
+                self._http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=self.default_pool_size))
+                for url_prefix, pool_size in self.pool_sizes.items():
+                    self._http_session.mount(url_prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                self._http_session.cookies = self.cookie_jar
+            return self._http_session
+
+    @property
+    def cookie_jar(self):
+        with self.lazy_lock:
+            if self._cookie_jar is None:
+                from .cookies import PersistentCookieJar
+                self._cookie_jar = PersistentCookieJar(self.cookie_file)
+                try:
+                    self._cookie_jar.load(ignore_discard=True, ignore_expires=True)
+                except IOError:
+                    pass
+            return self._cookie_jar
+
+    @property
+    def config(self):
+        with self.lazy_lock:
+            if self._config is None:
+                self._config = self.get_config()
+            return self._config
+
+    @property
+    def search_index(self):
+        with self.lazy_lock:
+            if self._search_index is None:
+                from .searchindex import SearchIndex
+                self._search_index = SearchIndex(os.path.join(self.save_path, 'search.db'))
+            return self._search_index
+
+    @property
+    def watch_history(self):
+        with self.lazy_lock:
+            if self._watch_history is None:
+                from .prewarm import WatchHistory
+                self._watch_history = WatchHistory(os.path.join(self.save_path, 'watch_history.json'))
+            return self._watch_history
+
+    @property
+    def stream_cache(self):
+        with self.lazy_lock:
+            if self._stream_cache is None:
+                from .prewarm import StreamCache
+                self._stream_cache = StreamCache(os.path.join(self.save_path, 'streams.json'))
+            return self._stream_cache
+
+    @property
+    def valid_session(self):
+        return self.is_session_valid()
 
     class VueError(Exception):
         def __init__(self, value):
@@ -43,8 +248,14 @@ class psvue(object):
         def __str__(self):
             return repr(self.value)
 
-    def log(self, string):
-        if self.debug:
+    def log_enabled(self, level):
+        return level <= self.log_level
+
+    def log(self, string, *args, **kwargs):
+        """Log a message if its level is enabled. The message is only formatted with args if it will be logged."""
+        if self.log_enabled(kwargs.get('level', self.LOG_DEBUG)):
+            if args:
+                string = string % args
             try:
                 print '[psvue]: %s' % string
             except UnicodeEncodeError:
@@ -55,40 +266,162 @@ class psvue(object):
             except:
                 pass
 
-    def make_request(self, url, method, payload=None, headers=None, return_req=False):
-        """Make an HTTP request. Return the response."""
-        self.log('Request URL: %s' % url)
+    def truncate(self, content):
+        """Return content cut down to log_body_limit bytes for logging."""
+        if self.log_body_limit and len(content) > self.log_body_limit:
+            return '%s... [%s bytes truncated]' % (content[:self.log_body_limit], len(content) - self.log_body_limit)
+        return content
+
+    def get_cache_ttl(self, url):
+        """Return the cache TTL in seconds for an URL, or 0 if responses from it shouldn't be cached."""
+        for url_fragment, ttl in self.cache_ttls:
+            if url_fragment in url:
+                return ttl
+        return 0
+
+    def make_request(self, url, method, payload=None, headers=None):
+        """Make an HTTP request. Return the response as a VueResponse.
+        Identical requests made at the same time (e.g. from several service threads) share one upstream call."""
+        if isinstance(payload, dict):
+            payload_key = json.dumps(payload, sort_keys=True)
+        else:
+            payload_key = payload
+        key = (method, url, payload_key, tuple(sorted((headers or {}).items())))
         try:
-            if method == 'get':
-                req = self.http_session.get(url, params=payload, headers=headers, allow_redirects=False, verify=self.verify_ssl)
-            elif method == 'put':
-                req = self.http_session.put(url, params=payload, headers=headers, allow_redirects=False, verify=self.verify_ssl)
-            else:  # post
-                req = self.http_session.post(url, data=payload, headers=headers, allow_redirects=False, verify=self.verify_ssl)
-            self.log('Response code: %s' % req.status_code)
-            self.log('Response: %s' % req.content)
-            self.log('Headers: %s' % req.headers)
-            self.cookie_jar.save(ignore_discard=True, ignore_expires=False)
+            return self.single_flight.do(key, self._make_request, url, method, payload, headers)
+        except self.VueError as error:
+            if error.value not in self.SESSION_ERRORS or getattr(self.recovery_local, 'active', False):
+                raise
+            # requests failing at the same time share one recovery
+            if not self.single_flight.do('recover_session', self.recover_session, error.value):
+                raise
+            self.log('Retrying request after recovering the session: %s', url, level=self.LOG_INFO)
+            return self.single_flight.do(key, self._make_request, url, method, payload, headers)
 
-            try:
-                if json.loads(req.content)['header']['error']:
-                    raise self.VueError(json.loads(req.content)['header']['error']['message'])
-            except KeyError:
-                pass
-            except ValueError:
-                pass
+    def _make_request(self, url, method, payload=None, headers=None):
+        import requests
+        self.log('Request URL: %s', url)
+        started = time.time()
+        cache_ttl = 0
+        cached = None
+        if method == 'get':
+            cache_ttl = self.get_cache_ttl(url)
+        if cache_ttl:
+            cache_key = self.cache.make_key(url, payload)
+            cached = self.cache.get(cache_key)
+            if cached:
+                if self.cache.is_fresh(cached):
+                    self.log('Using cached response for: %s', url)
+                    self.count('cache_hits')
+                    self.record_request(url, method, 'hit', started, 200, len(cached['content']))
+                    return VueResponse(200, {}, cached['content'], from_cache=True)
+                headers = dict(headers or {}, **self.cache.validators(cached))
+        try:
+            req = self.send_request(url, method, payload, headers)
+            latency = time.time() - started
+            self.count('requests')
+            self.count('bytes_received', len(req.content))
+            self.log('Response code: %s', req.status_code)
+            if self.log_enabled(self.LOG_VERBOSE):
+                self.log('Response: %s', self.truncate(req.content), level=self.LOG_VERBOSE)
+                self.log('Headers: %s', req.headers, level=self.LOG_VERBOSE)
 
-            if return_req:
-                return req
-            else:
-                return req.content
+            if cached and req.status_code == 304:
+                self.log('Cached response revalidated for: %s', url)
+                self.cache.revalidated(cache_key, cache_ttl)
+                self.count('revalidated')
+                self.record_request(url, method, 'revalidated', started, 304, len(req.content), latency)
+                return VueResponse(200, req.headers, cached['content'], from_cache=True)
+
+            response = VueResponse(req.status_code, req.headers, req.content, cookies=req.cookies.get_dict())
+            decode_started = time.time()
+            error = response.error  # decodes the JSON content
+            self.record_request(url, method, 'miss' if cache_ttl else 'none', started, req.status_code,
+                                len(req.content), latency, time.time() - decode_started)
+            if error:
+                raise self.VueError(error)
+
+            if cache_ttl and req.status_code == 200:
+                self.cache.store(cache_key, req.content, req.headers, cache_ttl)
+
+            return response
         except requests.exceptions.ConnectionError as error:
-            self.log('Connection Error: - %s' % error.message)
+            self.log('Connection Error: - %s', error, level=self.LOG_ERROR)
+            self.record_request(url, method, 'miss' if cache_ttl else 'none', started)
             raise
         except requests.exceptions.RequestException as error:
-            self.log('Error: - %s' % error.value)
+            self.log('Error: - %s', error, level=self.LOG_ERROR)
+            self.record_request(url, method, 'miss' if cache_ttl else 'none', started)
             raise
 
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def get_stats(self):
+        """Return a snapshot of the request counters since this instance was created."""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['coalesced'] = self.single_flight.coalesced
+        return stats
+
+    def record_request(self, url, method, cache, started, status_code=None, size=0, latency=None, decode_time=0):
+        """Keep the timings of one request. cache is 'hit', 'miss', 'revalidated' or 'none' for uncached URLs;
+        status_code is None if the request failed. latency defaults to the time since started."""
+        if latency is None:
+            latency = time.time() - started
+        record = {
+            'url': url.split('?')[0],
+            'method': method,
+            'started': round(started, 3),
+            'status': status_code,
+            'cache': cache,
+            'latency': round(latency, 4),
+            'decode_time': round(decode_time, 4),
+            'bytes': size
+        }
+        with self.stats_lock:
+            self.request_records.append(record)
+
+    def get_request_records(self, since=0):
+        """Return the request records kept for requests started at or after the since timestamp, oldest first."""
+        with self.stats_lock:
+            return [record for record in self.request_records if record['started'] >= since]
+
+    def pop_request_records(self):
+        """Return and forget the request records kept since the last call, oldest first."""
+        with self.stats_lock:
+            records = list(self.request_records)
+            self.request_records.clear()
+        return records
+
+    def send_request(self, url, method, payload=None, headers=None):
+        """Send the request over the pooled session. GET requests are retried with a jittered exponential
+        backoff on connection errors, timeouts and server errors."""
+        import requests
+        attempts = self.max_retries + 1 if method == 'get' else 1
+        for attempt in range(attempts):
+            retries_left = attempt < attempts - 1
+            try:
+                if method == 'get':
+                    req = self.http_session.get(url, params=payload, headers=headers, allow_redirects=False,
+                                                verify=self.verify_ssl, timeout=self.timeout)
+                elif method == 'put':
+                    req = self.http_session.put(url, params=payload, headers=headers, allow_redirects=False,
+                                                verify=self.verify_ssl, timeout=self.timeout)
+                else:  # post
+                    req = self.http_session.post(url, data=payload, headers=headers, allow_redirects=False,
+                                                 verify=self.verify_ssl, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if not retries_left:
+                    raise
+                self.log('Request failed (%s), retrying.', error, level=self.LOG_INFO)
+            else:
+                if req.status_code not in self.RETRY_STATUS_CODES or not retries_left:
+                    return req
+                self.log('Server error %s, retrying.', req.status_code, level=self.LOG_INFO)
+            time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
     def get_grant_code(self):
         """Try to save grant code needed for PS Vue authentication."""
         url = 'https://auth.api.sonyentertainmentnetwork.com/2.0/oauth/authorize'
@@ -101,12 +434,12 @@ class psvue(object):
             'nonce': str(time.time())  # unix timestamp
         }
 
-        req = self.make_request(url, 'get', payload=params, return_req=True)
+        response = self.make_request(url, 'get', payload=params)
         try:
-            self.save_credentials(code=req.headers['x-np-grant-code'])
+            self.save_credentials(code=response.headers['x-np-grant-code'])
             return True
         except KeyError:
-            self.log('Unable to save grant code. Login attempt was most likely unsuccessful.')
+            self.log('Unable to save grant code. Login attempt was most likely unsuccessful.', level=self.LOG_ERROR)
             return False
 
     def login_to_account(self, username, password):
@@ -126,46 +459,123 @@ class psvue(object):
         url = 'https://sentv-user-auth.totsuko.tv/sentv_user_auth/ws/web/oauth2/token'
         payload = {
             'device_type_id': 'web2-w',
-            'device_id': self.get_credentials()['device_id'],
-            'code': self.get_credentials()['code'],
+            'device_id': self.credentials['device_id'],
+            'code': self.credentials['code'],
             'issuer_id': '4'
         }
 
-        data = self.make_request(url, 'get', payload=payload)
-        json_data = json.loads(data)
-        if json_data['body']['status'] == 'AUTHENTICATED':
-            self.save_credentials(expiry_date=json_data['body']['expiry_date'])
+        response = self.make_request(url, 'get', payload=payload)
+        if response.body['status'] == 'AUTHENTICATED':
+            self.save_credentials(expiry_date=response.body['expiry_date'])
         else:
-            error_message = json_data['header']['error']['message']
-            raise self.VueError(error_message)
+            raise self.VueError(response.error)
 
     def login(self, username=None, password=None):
         """Complete login process for PlayStation Vue."""
         if username and password:
-            if self.get_credentials()['code']:
+            if self.credentials['code']:
                 try:
                     self.authenticate()
                     return True
                 except self.VueError:
                     pass
 
-            self.login_to_account(username, password)
-            if not self.get_grant_code():
-                raise self.VueError('Login failed.')
-            else:
-                try:
-                    self.authenticate()
-                except self.VueError:
-                    raise
+            self.login_with_password(username, password)
         else:
             raise self.VueError('No username and password supplied.')
 
+    def login_with_password(self, username, password):
+        """Log in to PlayStation Network, fetch a new grant code and authenticate with it."""
+        self.login_to_account(username, password)
+        if not self.get_grant_code():
+            raise self.VueError('Login failed.')
+        self.authenticate()
+
+    def session_expires_in(self):
+        """Return the seconds until the session expires, negative if it already has."""
+        expiry_date = self.parse_datetime(self.credentials['expiry_date'])
+        return calendar.timegm(expiry_date.utctimetuple()) - time.time()
+
+    def needs_renewal(self):
+        """Return whether a session with a selected profile is within renewal_window of expiring (or has expired)
+        and no renewal failed in the last renewal_retry_delay seconds."""
+        if not self.renewal_window or not self.credentials['profile_id']:
+            return False
+        # kept with the credentials, so that plugin invocations don't each retry a failing renewal
+        renewal_attempted = self.credentials.get('renewal_attempted') or 0
+        if 0 <= time.time() - renewal_attempted < self.renewal_retry_delay:
+            return False
+        return self.session_expires_in() < self.renewal_window
+
+    def renew_session(self):
+        """Authenticate again with the stored grant code, or log in with the password if the code is rejected.
+        The selected profile is kept. Return whether the session was renewed."""
+        self.save_credentials(renewal_attempted=time.time())
+        try:
+            if self.credentials['code']:
+                try:
+                    self.authenticate()
+                    self.log('Session renewed with the grant code.', level=self.LOG_INFO)
+                    return True
+                except self.VueError as error:
+                    self.log('Renewing the session with the grant code failed: %s', error, level=self.LOG_INFO)
+            if self.username and self.password:
+                self.login_with_password(self.username, self.password)
+                self.log('Session renewed with the password.', level=self.LOG_INFO)
+                return True
+        except Exception as error:  # the session stays as it is and the renewal is tried again later
+            self.log('Renewing the session failed: %s', error, level=self.LOG_ERROR)
+        return False
+
+    def recover_session(self, reason):
+        """Recover from a session error (one of SESSION_ERRORS) with the cheapest remedy that works:
+        authenticate again with the stored grant code, and only if that fails log in with the password.
+        The selected profile is kept. Return whether the session was recovered."""
+        self.log('Recovering the session from: %s', reason, level=self.LOG_INFO)
+        started = time.time()
+        self.recovery_local.active = True
+        try:
+            if self.credentials['code']:
+                try:
+                    self.authenticate()
+                    return self._recovered(started, 'grant code')
+                except (self.VueError, KeyError) as error:
+                    self.log('Authenticating with the grant code failed: %s', error, level=self.LOG_INFO)
+            if self.username and self.password:
+                self.login_with_password(self.username, self.password)
+                self.count('recovery_logins')
+                return self._recovered(started, 'password')
+        except Exception as error:
+            self.log('Recovering the session failed: %s', error, level=self.LOG_ERROR)
+        finally:
+            self.recovery_local.active = False
+        self.count('recovery_failures')
+        self.count('recovery_time', time.time() - started)
+        return False
+
+    def _recovered(self, started, remedy):
+        elapsed = time.time() - started
+        self.count('recoveries')
+        self.count('recovery_time', elapsed)
+        self.log('Session recovered with the %s in %.2f seconds.', remedy, elapsed, level=self.LOG_INFO)
+        return True
+
+    def renew_session_in_background(self):
+        """Start renew_session() on a worker thread if the session needs renewal.
+        Return a Future for its result, or None if no renewal was needed."""
+        if not self.needs_renewal():
+            return None
+        pool = WorkerPool(1)
+        renewal = pool.submit(self.renew_session)
+        pool.shutdown()
+        return renewal
+
     def is_session_valid(self):
         """Return whether the PS Vue session is valid and that a profile has been selected."""
         utcnow = datetime.utcnow()
-        expiry_date = self.parse_datetime(self.get_credentials()['expiry_date'])
+        expiry_date = self.parse_datetime(self.credentials['expiry_date'])
         expiry_date = expiry_date.replace(tzinfo=None)
-        profile_selected = self.get_credentials()['profile_id']
+        profile_selected = self.credentials['profile_id']
 
         if expiry_date > utcnow and profile_selected:
             return True
@@ -173,25 +583,64 @@ class psvue(object):
             return False
 
     def get_stream_url(self, airing_id=None, channel_id=None):
-        """Return the stream URL for a program."""
+        """Return the manifest URL of a program or channel along with its variant streams.
+        Channels count towards the watch history and are answered from the prewarmed streams when possible."""
+        if channel_id:
+            self.watch_history.record(channel_id)
+            stream_url = self.stream_cache.get(channel_id)
+            if stream_url:
+                self.log('Using prewarmed stream for channel: %s', channel_id)
+                return stream_url
+        return self.resolve_stream_url(airing_id, channel_id)
+
+    def resolve_stream_url(self, airing_id=None, channel_id=None):
+        """Request the manifest URL of a program or channel and parse its variant streams."""
         stream_url = {}
         if airing_id:
             url = 'https://media-framework.totsuko.tv/media-framework/media/v2.1/stream/airing/%s' % airing_id
         else:
             url = 'https://media-framework.totsuko.tv/media-framework/media/v2.1/stream/channel/%s' % channel_id
-        stream_data = self.make_request(url, 'get')
-        stream_dict = json.loads(stream_data)
-        stream_url['manifest'] = stream_dict['body']['video']
-        stream_url['bitrates'] = self.parse_m3u8_manifest(stream_url['manifest'])
+        response = self.make_request(url, 'get')
+        stream_url['manifest'] = response.body['video']
+        stream_url['variants'] = self.parse_m3u8_manifest(stream_url['manifest'], response.cookies.get('reqPayload'))
 
         return stream_url
 
+    def resolve_streams(self, airing_ids, workers=4):
+        """Resolve the stream URLs for several airings in parallel.
+        Return a dict with a Future for each airing ID; Future.result() returns what get_stream_url() would."""
+        pool = WorkerPool(min(workers, len(airing_ids)))
+        streams = {}
+        for airing_id in airing_ids:
+            streams[airing_id] = pool.submit(self.get_stream_url, airing_id)
+        pool.shutdown()
+
+        return streams
+
+    def prewarm_channels(self, count=3, wait=True):
+        """Resolve the streams of the count most watched channels into the stream cache, skipping the ones
+        that are still cached. Without wait the streams are resolved in the background."""
+        channel_ids = [channel_id for channel_id in self.watch_history.top(count)
+                       if not self.stream_cache.get(channel_id)]
+        if not channel_ids:
+            return
+        self.log('Prewarming streams for channels: %s', channel_ids)
+        pool = WorkerPool(min(2, len(channel_ids)))
+        for channel_id in channel_ids:
+            pool.submit(self._prewarm_channel, channel_id)
+        pool.shutdown(wait)
+
+    def _prewarm_channel(self, channel_id):
+        try:
+            self.stream_cache.store(channel_id, self.resolve_stream_url(channel_id=channel_id))
+        except Exception as error:  # a failed prewarm only means the channel is resolved when played
+            self.log('Prewarming channel %s failed: %s', channel_id, error, level=self.LOG_INFO)
+
     def get_profiles(self):
         """Return a list of the PS Vue profiles."""
         profiles = []
         url = self.config['epgUserSessionBaseURL'] + 'profile/ids'
-        profiles_data = self.make_request(url, 'get')
-        profiles_dict = json.loads(profiles_data)['body']['profiles']
+        profiles_dict = self.make_request(url, 'get').body['profiles']
 
         for profile in profiles_dict:
             profiles.append(profile)
@@ -209,37 +658,59 @@ class psvue(object):
     def refresh_profile_data(self, profile_id):
         """Save/refresh the returned profile data in a dict."""
         url = self.config['epgUserSessionBaseURL'] + 'profile/%s' % profile_id
-        data = self.make_request(url, 'get')
-        try:
-            json_data = json.loads(data)
-        except ValueError:
-            json_data = False
+        response = self.make_request(url, 'get')
 
-        if json_data:
+        if response.json:
             profile_data = {
                 'profile_data': {
-                    'favorites': json_data['body']['favorites']
+                    'favorites': response.body['favorites']
                 }
             }
-            self.save_credentials(profile_data=profile_data, profile_id=profile_id)
+            self.save_credentials(profile_data=profile_data, profile_id=profile_id, profile_data_time=time.time())
             return True
         else:
             self.reset_profile()
             return False
 
+    def is_profile_data_fresh(self):
+        """Return whether the saved profile data is younger than profile_data_ttl."""
+        profile_data_time = self.credentials.get('profile_data_time')
+        if not self.credentials['profile_data'] or not profile_data_time:
+            return False
+        return 0 <= time.time() - profile_data_time < self.profile_data_ttl
+
+    def invalidate_profile_data(self):
+        """Make the next post request refresh the profile data, e.g. after the favorites changed."""
+        with self.lazy_lock:
+            if self.credentials.get('profile_data_time'):
+                self.credentials['profile_data_time'] = None
+                self.write_credentials()
+
+    def check_favorites(self, programs):
+        """Invalidate the saved profile data if one of the listed programs was made a favorite after it was saved.
+        Removed favorites can't be detected from listings; they're picked up when the profile data expires."""
+        profile_data_time = self.credentials.get('profile_data_time')
+        if not profile_data_time:
+            return
+        for program in programs:
+            favorite_date = program.get('favorite_date')
+            if favorite_date and calendar.timegm(self.parse_datetime(favorite_date).utctimetuple()) > profile_data_time:
+                self.log('Favorites changed since the profile data was saved.')
+                self.invalidate_profile_data()
+                return
+
     def reset_profile(self):
         """Reset the selected profile."""
-        credentials = self.get_credentials()
-        credentials['profile_id'] = None
-        with open(self.credentials_file, 'w') as fh_credentials:
-            fh_credentials.write(json.dumps(credentials))
+        with self.lazy_lock:
+            if self.credentials['profile_id'] is not None:
+                self.credentials['profile_id'] = None
+                self.write_credentials()
 
     def get_categories(self):
         """Return all PS Vue categories."""
         categories = []
         url = self.base_url + 'menu.json'
-        data = self.make_request(url, 'get')
-        json_data = json.loads(data)['body']['sections']
+        json_data = self.make_request(url, 'get').body['sections']
 
         for section in json_data:
             for item in section['items']:
@@ -248,12 +719,12 @@ class psvue(object):
 
         return categories
 
-    def parse_category_sortings(self, uri, offset='0', size='999'):
-        """Parse the available category sortings and return them in a dict."""
+    def parse_category_sortings(self, uri, offset=None, size=None):
+        """Parse the available category sortings and return them in a dict.
+        The <offset> and <size> placeholders are left in the URIs for get_programs() unless values are supplied."""
         category_sortings = []
         url = self.base_url + uri
-        data = self.make_request(url, 'get')
-        json_data = json.loads(data)['body']
+        json_data = self.make_request(url, 'get').body
 
         for item in json_data['expandable_grids']:
             if 'request_method' in item.keys():
@@ -283,17 +754,19 @@ class psvue(object):
                 category_sortings.append(category_sorting)
 
         for sorting in category_sortings:
-            sorting['uri'] = sorting['uri'].replace('<offset>', offset)
-            sorting['uri'] = sorting['uri'].replace('<size>', size)
+            if offset is not None:
+                sorting['uri'] = sorting['uri'].replace('<offset>', offset)
+            if size is not None:
+                sorting['uri'] = sorting['uri'].replace('<size>', size)
 
         return category_sortings
 
-    def parse_channel_sortings(self, channel_id, type='channel', offset='0', size='999'):
-        """Parse the available channel sortings and return them in a dict."""
+    def parse_channel_sortings(self, channel_id, type='channel', offset=None, size=None):
+        """Parse the available channel sortings and return them in a dict.
+        The <offset> and <size> placeholders are left in the URIs for get_programs() unless values are supplied."""
         channel_sortings = []
         url = self.base_url + self.config['channel']
-        data = self.make_request(url, 'get')
-        json_data = json.loads(data)['body']
+        json_data = self.make_request(url, 'get').body
 
         for key in json_data.keys():
             try:
@@ -315,14 +788,17 @@ class psvue(object):
         for sorting in channel_sortings:
             sorting['uri'] = sorting['uri'].replace('<type>', type)
             sorting['uri'] = sorting['uri'].replace('<id>', channel_id)
-            sorting['uri'] = sorting['uri'].replace('<offset>', offset)
-            sorting['uri'] = sorting['uri'].replace('<size>', size)
+            if offset is not None:
+                sorting['uri'] = sorting['uri'].replace('<offset>', offset)
+            if size is not None:
+                sorting['uri'] = sorting['uri'].replace('<size>', size)
 
         return channel_sortings
 
     def get_programs(self, request_method, uri=None, program_id=None, search_query=None, expiration_filter=None, offset='0', size='999'):
         """Retrieve the programs by providing an URI (from the parsed sortings)/program ID/search query."""
         if uri:
+            uri = uri.replace('<offset>', str(offset)).replace('<size>', str(size))
             url = self.config['epgContentBaseURL'] + uri
         elif program_id:
             url = self.config['epgContentBaseURL'] + 'details/items/program/%s/episodes/offset/%s/size/%s' % (program_id, offset, size)
@@ -331,64 +807,158 @@ class psvue(object):
         elif search_query:
             url = self.config['epgContentBaseURL'] + 'search/items/%s/offset/%s/size/%s' % (search_query, offset, size)
         else:
-            self.log('No URI/program ID/search query supplied.')
+            self.log('No URI/program ID/search query supplied.', level=self.LOG_ERROR)
             return False
 
         if request_method == 'post':
             # profile_data is required with all post requests
-            self.refresh_profile_data(self.get_credentials()['profile_id'])
-            payload = json.dumps(self.get_credentials()['profile_data'])
+            refreshed = not self.is_profile_data_fresh()
+            if refreshed:
+                self.refresh_profile_data(self.credentials['profile_id'])
             headers = {'Content-Type': 'application/json'}
+            try:
+                response = self.make_request(url, method=request_method, payload=json.dumps(self.credentials['profile_data']),
+                                             headers=headers)
+            except self.VueError:
+                if refreshed:
+                    raise
+                self.log('Request rejected with cached profile data. Refreshing it and retrying.', level=self.LOG_INFO)
+                self.refresh_profile_data(self.credentials['profile_id'])
+                response = self.make_request(url, method=request_method, payload=json.dumps(self.credentials['profile_data']),
+                                             headers=headers)
         else:
-            payload = None
-            headers = None
+            response = self.make_request(url, method=request_method)
 
-        data = self.make_request(url, method=request_method, payload=payload, headers=headers)
-        json_data = json.loads(data)
-        programs = json_data['body']['items']
+        programs = response.body['items']
         for program in programs:
             if program_id:
                 program['detailed'] = True
             else:
                 program['detailed'] = False
+        self.check_favorites(programs)
+
+        if not program_id:
+            # indexed on flush(), after the listing has been handed to Kodi
+            with self.index_lock:
+                self.index_queue.extend(programs)
 
         return programs
 
-    def parse_m3u8_manifest(self, manifest_url):
-        """Return the stream URL along with its bitrate."""
-        streams = {}
-        m3u8_manifest = self.make_request(manifest_url, 'get')
-        m3u8_header = {'Cookie': 'reqPayload=' + self.get_cookie_by_name('reqPayload').value,
+    def index_programs(self, programs):
+        """Add listed programs and channels to the local search index."""
+        import sqlite3
+        try:
+            self.search_index.add(programs)
+        except sqlite3.Error as error:
+            self.log('Unable to update the search index: %s', error, level=self.LOG_ERROR)
+
+    def index_queued(self):
+        """Add the items listed since the last call to the local search index."""
+        with self.index_lock:
+            programs, self.index_queue = self.index_queue, []
+        if programs:
+            self.index_programs(programs)
+
+    def search_local(self, search_query, limit=100):
+        """Return the programs and channels in the local search index matching search_query."""
+        import sqlite3
+        try:
+            return self.search_index.search(search_query, limit)
+        except sqlite3.Error as error:
+            self.log('Unable to search the local index: %s', error, level=self.LOG_ERROR)
+            return []
+
+    def iter_programs(self, request_method, uri=None, program_id=None, search_query=None, expiration_filter=None,
+                      page_size=50, offset=0):
+        """Yield the programs one page (a list of at most page_size programs) at a time, starting at offset."""
+        pageable = not uri or '<offset>' in uri
+        while True:
+            programs = self.get_programs(request_method, uri, program_id, search_query, expiration_filter,
+                                         offset=str(offset), size=str(page_size))
+            if programs:
+                yield programs
+            if not pageable or not programs or len(programs) < page_size:
+                break
+            offset += page_size
+
+    def parse_m3u8_manifest(self, manifest_url, req_payload=None):
+        """Return the variant streams of the master playlist, highest bitrate first (see parse_master_playlist()).
+        The stream URLs carry the headers Kodi needs to play them. req_payload is the reqPayload cookie set
+        by the stream request; it's taken from the responses rather than the shared cookie jar because
+        several streams may be resolved at the same time."""
+        response = self.make_request(manifest_url, 'get')
+        req_payload = response.cookies.get('reqPayload') or req_payload
+        if not req_payload:
+            req_payload = self.get_cookie_by_name('reqPayload').value
+        m3u8_manifest = response.content
+        m3u8_header = {'Cookie': 'reqPayload=' + req_payload,
                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64; rv:52.0) Gecko/20100101 Firefox/52.0'
                        }
-        m3u8_obj = m3u8.loads(m3u8_manifest)
-        for playlist in m3u8_obj.playlists:
-            bitrate = int(playlist.stream_info.bandwidth) / 1000
-            if playlist.uri.startswith('http'):
-                stream_url = playlist.uri
-            else:
-                stream_url = manifest_url[:manifest_url.rfind('/') + 1] + playlist.uri
-            streams[str(bitrate)] = stream_url + '|' + urlencode(m3u8_header)
+        return parse_master_playlist(m3u8_manifest, manifest_url, '|' + urlencode(m3u8_header))
 
-        return streams
+    def probe_throughput(self, stream_url, max_size=4 * 1024 * 1024):
+        """Download the first segment (at most max_size bytes) of a variant stream as returned by get_stream_url().
+        Return the number of bytes and the seconds it took, or None if the probe failed."""
+        import requests
+        url, _, header_string = stream_url.partition('|')
+        headers = dict(parse_qsl(header_string))
+        try:
+            playlist = self.send_request(url, 'get', headers=headers)
+            if playlist.status_code != 200:
+                return None
+            segment_url = first_segment(playlist.content, url)
+            if not segment_url:
+                return None
+            started = time.time()
+            response = self.http_session.get(segment_url, headers=headers, stream=True, verify=self.verify_ssl,
+                                             timeout=self.timeout)
+            size = 0
+            try:
+                if response.status_code != 200:
+                    return None
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size >= max_size:
+                        break
+            finally:
+                response.close()
+            seconds = time.time() - started
+        except requests.exceptions.RequestException as error:
+            self.log('Throughput probe failed: %s', error, level=self.LOG_INFO)
+            return None
+        self.log('Probed %s bytes in %.2f seconds.', size, seconds)
+        return size, seconds
 
     def get_cookie_by_name(self, name):
-        for cookie in self.cookie_jar:
-            if cookie.name == name:
-                return cookie
+        return self.cookie_jar.get_by_name(name)
+
+    def flush(self):
+        """Write state that is batched until the end of an invocation to disk."""
+        self.index_queued()
+        if self._cookie_jar is not None:
+            self._cookie_jar.save(ignore_discard=True, ignore_expires=False)
+        self.cache.flush()
+
+    @property
+    def credentials(self):
+        """The credentials dict, read from file the first time it's needed and kept in memory afterwards.
+        Changes to it are made, and written, while holding lazy_lock."""
+        with self.lazy_lock:
+            if self._credentials is None:
+                try:
+                    with open(self.credentials_file, 'r') as fh_credentials:
+                        self._credentials = json.loads(fh_credentials.read())
+                except (IOError, ValueError):
+                    self.reset_credentials()
+            return self._credentials
 
     def get_credentials(self):
-        """Get the credentials from file and return it in a dict."""
-        try:
-            with open(self.credentials_file, 'r') as fh_credentials:
-                return json.loads(fh_credentials.read())
-        except IOError:
-            self.reset_credentials()
-            with open(self.credentials_file, 'r') as fh_credentials:
-                return json.loads(fh_credentials.read())
+        """Return a copy of the credentials in a dict."""
+        with self.lazy_lock:
+            return dict(self.credentials)
 
     def reset_credentials(self):
-        """Reset the credentials file to default."""
+        """Reset the credentials to default."""
         credentials = {}
         utcnow = datetime.utcnow()
         credentials['device_id'] = str(uuid.uuid4())
@@ -396,31 +966,39 @@ class psvue(object):
         credentials['expiry_date'] = utcnow.isoformat()
         credentials['profile_id'] = None
         credentials['profile_data'] = None
-        with open(self.credentials_file, 'w') as fh_credentials:
-            fh_credentials.write(json.dumps(credentials))
+        credentials['profile_data_time'] = None
+        credentials['renewal_attempted'] = None
+        with self.lazy_lock:
+            self._credentials = credentials
+            self.write_credentials()
 
-    def save_credentials(self, device_id=None, code=None, expiry_date=None, profile_id=None, profile_data=None):
-        """Save credentials to file."""
-        credentials = {}
-        if not device_id:
-            device_id = self.get_credentials()['device_id']
-        if not code:
-            code = self.get_credentials()['code']
-        if not expiry_date:
-            expiry_date = self.get_credentials()['expiry_date']
-        if not profile_id:
-            profile_id = self.get_credentials()['profile_id']
-        if not profile_data:
-            profile_data = self.get_credentials()['profile_data']
-
-        credentials['device_id'] = device_id
-        credentials['code'] = code
-        credentials['expiry_date'] = expiry_date
-        credentials['profile_id'] = profile_id
-        credentials['profile_data'] = profile_data
-
-        with open(self.credentials_file, 'w') as fh_credentials:
-            fh_credentials.write(json.dumps(credentials))
+    def save_credentials(self, device_id=None, code=None, expiry_date=None, profile_id=None, profile_data=None,
+                         profile_data_time=None, renewal_attempted=None):
+        """Update the credentials in memory and write them to file if anything changed."""
+        new_values = {
+            'device_id': device_id,
+            'code': code,
+            'expiry_date': expiry_date,
+            'profile_id': profile_id,
+            'profile_data': profile_data,
+            'profile_data_time': profile_data_time,
+            'renewal_attempted': renewal_attempted
+        }
+        with self.lazy_lock:
+            credentials = self.credentials
+            changed = False
+            for key, value in new_values.items():
+                if value and credentials.get(key) != value:
+                    credentials[key] = value
+                    changed = True
+
+            if changed:
+                self.write_credentials()
+
+    def write_credentials(self):
+        """Write the in-memory credentials to file in one atomic operation."""
+        with self.lazy_lock:
+            atomic_write(self.credentials_file, json.dumps(self._credentials))
 
     def get_config(self):
         """Return the config in a dict. Re-download if the config version doesn't match self.app_version."""
@@ -430,33 +1008,48 @@ class psvue(object):
             config_version = int(str(config['versioning']['version']).replace('.', ''))
             version_to_use = int(str(self.app_version).replace('_', ''))
             if config_version != version_to_use:
-                self.download_config()
-                config = json.load(open(config_path))['body']
+                config = self.download_config()
             return config
         except IOError:
-            self.download_config()
-            config = json.load(open(config_path))['body']
-            return config
+            return self.download_config()
 
     def download_config(self):
-        """Download the PS Vue iPad JSON configuration."""
+        """Download the PS Vue iPad JSON configuration. Return the config in a dict."""
         config_path = os.path.join(self.save_path, 'configuration.json')
-        config_data = self.make_request(self.base_url + 'configuration.json', 'get')
-        with open(config_path, 'w') as fh_config:
-            fh_config.write(config_data)
+        response = self.make_request(self.base_url + 'configuration.json', 'get')
+        atomic_write(config_path, response.content)
+        return response.body
 
     def utc_to_local(self, utc_dt):
         """Convert UTC datetime object to local time."""
-        # get integer timestamp to avoid precision lost
-        timestamp = calendar.timegm(utc_dt.timetuple())
-        local_dt = datetime.fromtimestamp(timestamp)
-        assert utc_dt.resolution >= timedelta(microseconds=1)
-        return local_dt.replace(microsecond=utc_dt.microsecond)
+        if utc_dt.tzinfo is not None:
+            utc_dt = (utc_dt - utc_dt.utcoffset()).replace(tzinfo=None)
+        # DST changes happen on a local quarter hour, which is a UTC quarter hour in every time zone
+        # (e.g. on the half hour in Adelaide), so the offset is looked up once per UTC quarter hour
+        quarter = (utc_dt.toordinal(), utc_dt.hour, utc_dt.minute // 15)
+        offset = _utc_offsets.get(quarter)
+        if offset is None:
+            start = utc_dt.replace(minute=utc_dt.minute // 15 * 15, second=0, microsecond=0)
+            timestamp = calendar.timegm(start.timetuple())
+            offset = datetime.fromtimestamp(timestamp) - datetime.utcfromtimestamp(timestamp)
+            _utc_offsets[quarter] = offset
+        return utc_dt + offset
 
     def parse_datetime(self, iso8601_string, localize=False):
         """Parse ISO8601 string to datetime object."""
-        datetime_obj = iso8601.parse_date(iso8601_string)
-        if localize:
-            return self.utc_to_local(datetime_obj)
-        else:
+        key = (iso8601_string, localize)
+        datetime_obj = _parsed_datetimes.get(key)
+        if datetime_obj is not None:
             return datetime_obj
+
+        datetime_obj = parse_api_datetime(iso8601_string)
+        if datetime_obj is None:
+            import iso8601
+            datetime_obj = iso8601.parse_date(iso8601_string)
+        if localize:
+            datetime_obj = self.utc_to_local(datetime_obj)
+
+        if len(_parsed_datetimes) >= MAX_PARSED_DATETIMES:
+            _parsed_datetimes.clear()
+        _parsed_datetimes[key] = datetime_obj
+        return datetime_obj
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Serve a long-lived psvue instance over a local socket and call it from the plugin
+"""
+import os
+import hmac
+import json
+import socket
+import binascii
+import threading
+import SocketServer
+
+from .psvue import psvue
+from .utils import atomic_write
+
+TOKEN_FILE = 'service_token'  # in the add-on profile, see create_token()
+
+# psvue methods that touch the network or the session state and are therefore run by the service
+REMOTE_METHODS = (
+    'get_categories',
+    'parse_category_sortings',
+    'parse_channel_sortings',
+    'get_programs',
+    'search_local',
+    'get_stream_url',
+    'probe_throughput',
+    'prewarm_channels',
+    'get_profiles',
+    'refresh_profile_data',
+    'invalidate_profile_data',
+    'reset_profile',
+    'get_credentials',
+    'is_session_valid',
+    'get_stats',
+    'get_request_records',
+    'pop_request_records',
+    'login'
+)
+
+# psvue methods that don't need the session and therefore run in the plugin process
+LOCAL_METHODS = (
+    'log_enabled',
+    'log',
+    'truncate',
+    'utc_to_local',
+    'parse_datetime',
+    'iter_programs',
+    'resolve_streams',
+    'return_profile_names'
+)
+
+
+def create_token(token_file):
+    """Write a new random shared secret to token_file and return it. The file is only readable by its owner,
+    so only processes running as the Kodi user can call the service."""
+    token = binascii.hexlify(os.urandom(16))
+    atomic_write(token_file, token)  # created with mkstemp(), i.e. mode 0600
+    return token
+
+
+def read_token(token_file):
+    """Return the shared secret written by the service, or None if there is none."""
+    try:
+        with open(token_file, 'r') as fh_token:
+            return fh_token.read().strip() or None
+    except IOError:
+        return None
+
+
+class VueRequestHandler(SocketServer.StreamRequestHandler):
+    """Handle one newline terminated JSON request and answer with one JSON response line."""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            if not hmac.compare_digest(str(request.get('token') or ''), self.server.token):
+                raise ValueError('Invalid service token.')
+            kwargs = dict((str(key), value) for key, value in request.get('kwargs', {}).items())
+            response = {'result': self.server.call(request['method'], request.get('args', []), kwargs)}
+        except psvue.VueError as error:
+            response = {'error': error.value, 'vue_error': True}
+        except Exception as error:
+            response = {'error': repr(error), 'vue_error': False}
+        self.wfile.write(json.dumps(response) + '\n')
+        # write the batched state (e.g. the search index) after answering, so the client doesn't wait for it
+        self.server.flush()
+
+
+class VueServer(SocketServer.ThreadingTCPServer):
+    """Keep one psvue instance (and with it its connection pool and caches) warm between plugin invocations."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, vue_factory, port, token, host='127.0.0.1'):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), VueRequestHandler)
+        self.vue_factory = vue_factory
+        self.token = str(token)  # every request has to carry it
+        self.lock = threading.Lock()
+        self._vue = None
+
+    @property
+    def vue(self):
+        with self.lock:
+            if self._vue is None:
+                self._vue = self.vue_factory()
+            return self._vue
+
+    def reset(self):
+        """Drop the psvue instance so the next call creates a new one, e.g. after the settings changed."""
+        with self.lock:
+            if self._vue is not None:
+                self._vue.flush()
+            self._vue = None
+
+    def flush(self):
+        with self.lock:
+            vue = self._vue
+        if vue is not None:
+            vue.flush()
+
+    def call(self, method, args, kwargs):
+        if method == 'ping':
+            return True
+        if method not in REMOTE_METHODS:
+            raise ValueError('Method not available: %s' % method)
+        return getattr(self.vue, method)(*args, **kwargs)
+
+
+class VueClient(object):
+    """A psvue stand-in that forwards the REMOTE_METHODS to a VueServer and runs the LOCAL_METHODS
+    (date parsing, paging, parallel stream resolution) in this process. Other psvue methods aren't available."""
+    VueError = psvue.VueError
+    SESSION_ERRORS = psvue.SESSION_ERRORS
+    LOG_NONE = psvue.LOG_NONE
+    LOG_ERROR = psvue.LOG_ERROR
+    LOG_INFO = psvue.LOG_INFO
+    LOG_DEBUG = psvue.LOG_DEBUG
+    LOG_VERBOSE = psvue.LOG_VERBOSE
+
+    def __init__(self, port, token, host='127.0.0.1', timeout=120, log_level=psvue.LOG_NONE, log_body_limit=2048):
+        self.address = (host, port)
+        self.token = token
+        self.timeout = timeout
+        self.log_level = log_level
+        self.log_body_limit = log_body_limit
+
+    def call(self, method, *args, **kwargs):
+        """Call a psvue method in the service and return its result."""
+        self.log('Calling %s in the service.', method)
+        connection = socket.create_connection(self.address, self.timeout)
+        try:
+            request = {'method': method, 'args': args, 'kwargs': kwargs, 'token': self.token}
+            connection.sendall(json.dumps(request) + '\n')
+            response = json.loads(connection.makefile('rb').readline())
+        finally:
+            connection.close()
+
+        if 'error' in response:
+            if response['vue_error']:
+                raise self.VueError(response['error'])
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def is_running(self):
+        """Return whether the service answers on its port and accepts the token."""
+        try:
+            return self.call('ping')
+        except (socket.error, ValueError, RuntimeError):
+            return False
+
+    @property
+    def valid_session(self):
+        return self.is_session_valid()
+
+    def flush(self):
+        """The service writes its own state after every call."""
+        pass
+
+
+def _remote_method(name):
+    def method(self, *args, **kwargs):
+        return self.call(name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(psvue, name).__doc__
+    return method
+
+
+for _name in REMOTE_METHODS:
+    setattr(VueClient, _name, _remote_method(_name))
+for _name in LOCAL_METHODS:
+    setattr(VueClient, _name, psvue.__dict__[_name])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+A local search index over the programs and channels the add-on has already listed
+"""
+import re
+import json
+import time
+import sqlite3
+import threading
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Return the lowercase word tokens in text."""
+    if not text:
+        return []
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex(object):
+    """An inverted index from title, episode title and genre tokens to API items, stored in SQLite.
+    Items are added or replaced one listing at a time, so the index never needs a full rebuild.
+    Items that haven't been listed for max_age seconds are dropped whenever items are added."""
+
+    def __init__(self, db_file, max_age=7 * 24 * 3600):
+        self.db_file = db_file
+        self.max_age = max_age
+        self.local = threading.local()
+        self.create_lock = threading.Lock()
+        self.created = False
+
+    @property
+    def db(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_file)
+            self.local.connection = connection
+            with self.create_lock:
+                if not self.created:
+                    connection.execute('CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, title TEXT, data TEXT, updated REAL)')
+                    connection.execute('CREATE TABLE IF NOT EXISTS tokens (token TEXT, key TEXT)')
+                    connection.execute('CREATE INDEX IF NOT EXISTS tokens_token ON tokens (token)')
+                    connection.execute('CREATE INDEX IF NOT EXISTS tokens_key ON tokens (key)')
+                    connection.execute('CREATE INDEX IF NOT EXISTS items_updated ON items (updated)')
+                    connection.commit()
+                    self.created = True
+        return connection
+
+    def item_key(self, item):
+        if item['sentv_type'] == 'channel':
+            return 'channel:%s' % item['id']
+        return 'program:%s' % item['id']
+
+    def item_tokens(self, item):
+        tokens = set(tokenize(item.get('title')))
+        tokens.update(tokenize(item.get('display_episode_title')))
+        for genre in item.get('genres') or []:
+            tokens.update(tokenize(genre.get('genre')))
+        return tokens
+
+    def add(self, items):
+        """Add or replace items (API program or channel dicts) in the index."""
+        db = self.db
+        now = time.time()
+        with db:
+            for item in items:
+                key = self.item_key(item)
+                if item['sentv_type'] == 'channel' and item.get('airings'):
+                    # a channel's airings are only needed to play it, and the guide lists hundreds of them
+                    item = dict(item)
+                    del item['airings']
+                db.execute('DELETE FROM tokens WHERE key = ?', (key,))
+                db.execute('INSERT OR REPLACE INTO items (key, title, data, updated) VALUES (?, ?, ?, ?)',
+                           (key, item.get('title'), json.dumps(item), now))
+                db.executemany('INSERT INTO tokens (token, key) VALUES (?, ?)',
+                               [(token, key) for token in self.item_tokens(item)])
+            self.prune(db, now - self.max_age)
+
+    def prune(self, db, updated_before):
+        """Drop the items last added before the updated_before timestamp. Doesn't commit."""
+        db.execute('DELETE FROM tokens WHERE key IN (SELECT key FROM items WHERE updated < ?)', (updated_before,))
+        db.execute('DELETE FROM items WHERE updated < ?', (updated_before,))
+
+    def search(self, query, limit=100):
+        """Return the indexed items where every query token is a prefix of one of the item's tokens.
+        Items whose title starts with the query come first."""
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        db = self.db
+        keys = None
+        for token in query_tokens:
+            rows = db.execute('SELECT key FROM tokens WHERE token >= ? AND token < ?', (token, token + u'\uffff'))
+            matches = set(row[0] for row in rows)
+            keys = matches if keys is None else keys & matches
+            if not keys:
+                return []
+
+        keys = list(keys)
+        rows = []
+        for start in range(0, len(keys), 500):  # stay below SQLite's host parameter limit
+            chunk = keys[start:start + 500]
+            rows.extend(db.execute('SELECT title, data FROM items WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk))
+
+        query = u' '.join(query_tokens)
+        rows.sort(key=lambda row: (not (row[0] or u'').lower().startswith(query), row[0]))
+        return [json.loads(row[1]) for row in rows[:limit]]
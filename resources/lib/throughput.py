@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Estimate the download throughput of each network the add-on is used on
+"""
+import json
+import time
+
+from .utils import atomic_write
+
+MIN_SAMPLE_BYTES = 64 * 1024  # smaller downloads mostly measure latency
+MAX_NETWORKS = 20
+
+
+class ThroughputEstimator(object):
+    """Keep an exponentially weighted moving average of the throughput in Kbps per network in state_file.
+    network is any string that tells networks apart, e.g. the gateway address."""
+
+    def __init__(self, state_file, network='default', weight=0.3):
+        self.state_file = state_file
+        self.network = network
+        self.weight = weight  # of a new sample in the average
+        self.dirty = False
+        try:
+            with open(self.state_file, 'r') as fh_state:
+                self.networks = json.loads(fh_state.read())
+        except (IOError, ValueError):
+            self.networks = {}
+
+    def add_sample(self, size, seconds):
+        """Add a download of size bytes that took seconds. Return whether the sample was used."""
+        if size < MIN_SAMPLE_BYTES or seconds <= 0:
+            return False
+        kbps = size * 8 / 1000.0 / seconds
+        network = self.networks.get(self.network)
+        if network:
+            network['kbps'] = network['kbps'] + self.weight * (kbps - network['kbps'])
+            network['samples'] += 1
+        else:
+            network = self.networks[self.network] = {'kbps': kbps, 'samples': 1}
+        network['updated'] = time.time()
+        self.dirty = True
+        return True
+
+    def estimate(self):
+        """Return the estimated throughput in Kbps on the current network, or None if it hasn't been measured."""
+        network = self.networks.get(self.network)
+        if network:
+            return network['kbps']
+        return None
+
+    def pick(self, variants, headroom=0.75):
+        """Return the highest bitrate variant that fits in headroom times the estimated throughput,
+        the lowest bitrate variant if none fits, or None without an estimate. variants is sorted from the
+        highest to the lowest bitrate."""
+        estimate = self.estimate()
+        if estimate is None or not variants:
+            return None
+        for variant in variants:
+            if variant['bitrate'] <= estimate * headroom:
+                return variant
+        return variants[-1]
+
+    def save(self):
+        if not self.dirty:
+            return
+        if len(self.networks) > MAX_NETWORKS:
+            networks = sorted(self.networks.items(), key=lambda x: x[1]['updated'], reverse=True)
+            self.networks = dict(networks[:MAX_NETWORKS])
+        atomic_write(self.state_file, json.dumps(self.networks))
+        self.dirty = False
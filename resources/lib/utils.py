@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Small helpers shared by the PlayStation Vue library modules
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path):
+    """Open a temporary file for writing that replaces path once the block exits without an error,
+    so readers never see a partially written file."""
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as fh_temp:
+            yield fh_temp
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # os.rename() won't replace an existing file on Windows
+            os.remove(path)
+            os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_write(path, data):
+    """Write data to path in one atomic operation."""
+    with atomic_open(path) as fh_temp:
+        fh_temp.write(data)
+
+
+def append_rolling(path, line, max_size=512 * 1024):
+    """Append a line to path. Once the file grows past max_size bytes it's moved to path.1
+    (replacing the previous one), so at most about twice max_size is kept."""
+    try:
+        if os.path.getsize(path) > max_size:
+            if os.path.exists(path + '.1'):
+                os.remove(path + '.1')
+            os.rename(path, path + '.1')
+    except OSError:
+        pass
+    with open(path, 'ab') as fh_log:
+        fh_log.write(line.rstrip('\n') + '\n')
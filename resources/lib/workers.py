@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+A minimal thread pool for running PlayStation Vue requests in the background
+"""
+import sys
+import threading
+import Queue
+
+
+class ResultTimeout(Exception):
+    """Raised by Future.result() when the task didn't finish in time."""
+
+
+class Future(object):
+    """The pending result of a task submitted to a WorkerPool."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Skip the task if it hasn't started yet."""
+        self.cancelled = True
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._event.set()
+
+    def result(self, timeout=None):
+        """Wait for the task to finish and return its result or raise its exception."""
+        if not self._event.wait(timeout):
+            raise ResultTimeout('Timed out waiting for the result.')
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class WorkerPool(object):
+    """Run callables on a fixed number of threads. The threads exit once shutdown() is called."""
+
+    def __init__(self, workers=4):
+        self.tasks = Queue.Queue()
+        self.threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            future, func, args, kwargs = task
+            if future.cancelled:
+                future.set_result(None)
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except:
+                future.set_exception(sys.exc_info())
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self.tasks.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self, wait=False):
+        """Let the threads exit after the queued tasks are processed."""
+        for _ in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+class SingleFlight(object):
+    """Run a call once for all callers asking for the same key at the same time and share its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Call func, or wait for the identical call already in flight. Return its result or raise its exception."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self.calls[key] = future
+                self.executed += 1
+                leader = True
+
+        if leader:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except:
+                future.set_exception(sys.exc_info())
+            finally:
+                with self.lock:
+                    del self.calls[key]
+        return future.result()
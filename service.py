@@ -0,0 +1,115 @@
+﻿# -*- coding: utf-8 -*-
+"""
+A Kodi service that keeps a warm PlayStation Vue session for the add-on
+"""
+import os
+import threading
+
+from resources.lib.psvue import psvue
+from resources.lib.remote import VueServer, TOKEN_FILE, create_token
+from resources.lib.guide import Guide
+from resources.lib.export import PVRExporter
+
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+addon = xbmcaddon.Addon()
+addon_profile = xbmc.translatePath(addon.getAddonInfo('profile'))
+logging_prefix = '[%s-%s]' % (addon.getAddonInfo('id'), addon.getAddonInfo('version'))
+
+
+def addon_log(string):
+    msg = '%s: %s' % (logging_prefix, string)
+    xbmc.log(msg=msg, level=xbmc.LOGDEBUG)
+
+
+def create_vue():
+    """Return a psvue instance configured from the add-on settings."""
+    if not xbmcvfs.exists(addon_profile):
+        xbmcvfs.mkdir(addon_profile)
+    settings = xbmcaddon.Addon()
+    verify_ssl = settings.getSetting('verify_ssl') != 'false'
+    log_levels = [psvue.LOG_ERROR, psvue.LOG_DEBUG, psvue.LOG_VERBOSE]
+    log_level = log_levels[int(settings.getSetting('log_level') or 0)]
+    log_body_limit = int(settings.getSetting('log_body_limit') or 0)
+    timeout = (int(settings.getSetting('connect_timeout') or 5), int(settings.getSetting('read_timeout') or 30))
+    max_retries = int(settings.getSetting('max_retries') or 0)
+    renewal_window = int(settings.getSetting('renewal_window') or 0) * 60
+
+    return psvue(addon_profile, verify_ssl=verify_ssl, log_level=log_level, log_body_limit=log_body_limit,
+                 timeout=timeout, max_retries=max_retries, username=settings.getSetting('email'),
+                 password=settings.getSetting('password'), renewal_window=renewal_window)
+
+
+def renew_session(server):
+    """Renew the session before it expires so that the plugin never has to wait for a login."""
+    vue = server.vue
+    if vue.needs_renewal():
+        addon_log('Session expires soon, renewing it.')
+        vue.renew_session()
+        vue.flush()
+
+
+def export_pvr(server, guide):
+    """Refresh the PVR export if it's enabled and the guide is stale. Return the guide for the next run."""
+    settings = xbmcaddon.Addon()
+    if settings.getSetting('pvr_auto_export') != 'true':
+        return guide
+    if not guide:
+        guide = Guide(server.vue, os.path.join(addon_profile, 'guide.json'))
+    if guide.is_stale():
+        guide.vue = server.vue  # the instance is recreated when the settings change
+        guide.refresh()
+        output_dir = xbmc.translatePath(settings.getSetting('pvr_export_path')) or os.path.join(addon_profile, 'pvr')
+        exporter = PVRExporter(guide, output_dir, os.path.join(addon_profile, 'pvr_state'),
+                               'plugin://%s/' % addon.getAddonInfo('id'))
+        regenerated = exporter.export()
+        addon_log('PVR export updated, %s channels changed.' % regenerated)
+    return guide
+
+
+class ServiceMonitor(xbmc.Monitor):
+    def __init__(self, server):
+        xbmc.Monitor.__init__(self)
+        self.server = server
+
+    def onSettingsChanged(self):
+        addon_log('Settings changed, the session will be recreated.')
+        self.server.reset()
+
+
+def run():
+    if addon.getSetting('use_service') == 'false':
+        addon_log('Service disabled in the settings.')
+        return
+
+    port = int(addon.getSetting('service_port'))
+    if not xbmcvfs.exists(addon_profile):
+        xbmcvfs.mkdir(addon_profile)
+    token = create_token(os.path.join(addon_profile, TOKEN_FILE))
+    server = VueServer(create_vue, port, token)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    addon_log('Service listening on port %s.' % port)
+
+    monitor = ServiceMonitor(server)
+    guide = None
+    while not monitor.waitForAbort(60):
+        try:
+            renew_session(server)
+        except Exception as error:
+            addon_log('Session renewal failed: %s' % error)
+        try:
+            guide = export_pvr(server, guide)
+        except Exception as error:
+            addon_log('PVR export failed: %s' % error)
+
+    server.shutdown()
+    server.server_close()
+    server.reset()
+    addon_log('Service stopped.')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Kodi's xbmc module
+"""
+import threading
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+
+messages = []  # everything logged with log()
+info_labels = {}  # answers for getInfoLabel()
+abort_requested = threading.Event()  # set it to stop Monitor.waitForAbort()
+
+
+def log(msg, level=LOGDEBUG):
+    messages.append(msg)
+
+
+def translatePath(path):
+    return path
+
+
+def getInfoLabel(label):
+    return info_labels.get(label, '')
+
+
+class Keyboard(object):
+    text = None  # what the next keyboard "types", None cancels it
+
+    def __init__(self, default='', heading=''):
+        self.heading = heading
+
+    def doModal(self):
+        pass
+
+    def isConfirmed(self):
+        return Keyboard.text is not None
+
+    def getText(self):
+        return Keyboard.text
+
+
+class Monitor(object):
+    def waitForAbort(self, timeout=None):
+        return abort_requested.wait(timeout)
+
+    def abortRequested(self):
+        return abort_requested.is_set()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Kodi's xbmcaddon module
+"""
+import os
+import re
+import glob
+
+settings = {}  # setting id -> value, as strings like Kodi returns them
+info = {
+    'id': 'plugin.video.psvue',
+    'version': '0.0.0',
+    'path': '.',
+    'profile': '.'
+}
+
+
+class Addon(object):
+    def __init__(self, id=None):
+        pass
+
+    def getSetting(self, setting_id):
+        return settings.get(setting_id, '')
+
+    def setSetting(self, setting_id, value):
+        settings[setting_id] = value
+
+    def getAddonInfo(self, info_id):
+        return info[info_id]
+
+    def getLocalizedString(self, string_id):
+        """The English string from the add-on in info['path'], or 'string <id>' if it has none."""
+        return strings(info['path']).get(string_id, 'string %s' % string_id)
+
+
+_strings = {}
+
+
+def strings(path):
+    if path not in _strings:
+        _strings[path] = {}
+        for po_file in glob.glob(os.path.join(path, 'resources', 'language', '*English*', 'strings.po')):
+            with open(po_file, 'r') as fh_po:
+                for string_id, text in re.findall(r'msgctxt "#(\d+)"\s+msgid "(.*)"', fh_po.read()):
+                    _strings[path][int(string_id)] = text
+    return _strings[path]
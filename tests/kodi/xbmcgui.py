@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Kodi's xbmcgui module
+"""
+
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path=None):
+        self.label = label
+        self.path = path
+        self.properties = {}
+        self.art = {}
+        self.info = {}
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def setArt(self, art):
+        self.art.update(art)
+
+    def setInfo(self, info_type, info):
+        self.info.update(info)
+
+    def addStreamInfo(self, stream_type, info):
+        pass
+
+
+class Dialog(object):
+    answers = []  # what the next dialogs answer, in order; ok dialogs don't take one
+    shown = []  # (dialog type, heading) of every dialog shown
+
+    def ok(self, heading, line1=None, *args):
+        Dialog.shown.append(('ok', heading))
+        return True
+
+    def yesno(self, heading, line1=None, *args, **kwargs):
+        Dialog.shown.append(('yesno', heading))
+        return Dialog.answers.pop(0)
+
+    def select(self, heading, options, *args):
+        Dialog.shown.append(('select', heading))
+        return Dialog.answers.pop(0)
+
+    def numeric(self, numeric_type, heading, *args):
+        Dialog.shown.append(('numeric', heading))
+        return Dialog.answers.pop(0)
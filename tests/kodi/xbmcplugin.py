@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Kodi's xbmcplugin module that records what the plugin listed or resolved
+"""
+items = []  # (url, ListItem, is folder) of every directory item
+resolved = []  # ListItems passed to setResolvedUrl()
+ended = []  # handles passed to endOfDirectory()
+
+
+def reset():
+    del items[:]
+    del resolved[:]
+    del ended[:]
+
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    items.append((url, listitem, isFolder))
+    return True
+
+
+def addDirectoryItems(handle, directory_items, totalItems=0):
+    items.extend(directory_items)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    ended.append(handle)
+
+
+def setResolvedUrl(handle, succeeded, listitem):
+    resolved.append(listitem)
+
+
+def setContent(handle, content):
+    pass
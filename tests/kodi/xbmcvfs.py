@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Kodi's xbmcvfs module
+"""
+import os
+
+
+def exists(path):
+    return os.path.exists(path)
+
+
+def mkdir(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return True
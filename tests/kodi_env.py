@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Load default.py or service.py against the Kodi stubs in tests/kodi. The stubs are configured
+through their module attributes, e.g. xbmcaddon.settings or xbmcgui.Dialog.answers.
+"""
+import os
+import imp
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, 'tests', 'kodi')
+if STUBS not in sys.path:
+    sys.path.insert(0, STUBS)
+
+import xbmc
+import xbmcaddon
+import xbmcgui
+import xbmcplugin
+
+
+def configure(profile, settings=None, root=ROOT):
+    """Point the add-on profile at a directory and replace the add-on settings."""
+    xbmcaddon.info['path'] = root
+    xbmcaddon.info['profile'] = profile
+    xbmcaddon.settings.clear()
+    xbmcaddon.settings.update(settings or {})
+
+
+def load_script(name, argv=None, root=ROOT, main=False):
+    """Import default.py or service.py from the add-on in root as a fresh module. Its __main__ block only runs
+    with main, as when Kodi runs the script. argv is the plugin invocation,
+    e.g. ['plugin://plugin.video.psvue/', '1', '?action=search']."""
+    sys.argv = argv or ['plugin://plugin.video.psvue/', '1', '']
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    path = os.path.join(root, '%s.py' % name)
+    if not main:
+        return imp.load_source('psvue_%s' % name, path)
+    caller = sys.modules.pop('__main__', None)  # load_source would run the script in the caller's namespace
+    try:
+        return imp.load_source('__main__', path)
+    finally:
+        if caller is not None:
+            sys.modules['__main__'] = caller
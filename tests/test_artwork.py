@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from resources.lib.artwork import ArtworkResolver
+from resources.lib.models import Program
+
+TILE = [{'src': 'tile.png', 'width': '640'}]
+LOGO = [{'src': 'logo.png', 'width': '320'}]
+
+
+class ArtworkTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.artwork = ArtworkResolver(os.path.join(self.path, 'artwork.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_channel_tile_and_program_logo_are_cached_apart(self):
+        channel = Program({'id': 7, 'sentv_type': 'channel', 'title': 'Channel', 'urls': TILE}, self.artwork)
+        program = Program({'id': 1, 'sentv_type': 'Series', 'title': 'Show',
+                           'channel': {'channel_id': 7, 'urls': LOGO}}, self.artwork)
+        self.assertEqual(channel.image, 'tile.png')
+        self.assertEqual(program.channel_logo, 'logo.png')
+
+    def test_logos_survive_a_save(self):
+        self.artwork.channel_logo(7, LOGO)
+        self.artwork.save()
+        self.assertEqual(ArtworkResolver(self.artwork.cache_file).channel_logo(7, TILE), 'logo.png')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from resources.lib.cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_hit_does_not_write_the_index(self):
+        key = self.cache.make_key('https://example.com/menu.json')
+        self.cache.store(key, '{}', {}, 60)
+        os.utime(self.cache.index_file, (1000000000, 1000000000))
+
+        self.assertEqual(self.cache.get(key)['content'], '{}')
+        self.assertEqual(os.path.getmtime(self.cache.index_file), 1000000000)
+        self.assertTrue(self.cache.dirty)
+
+    def test_flush_writes_access_times(self):
+        key = self.cache.make_key('https://example.com/menu.json')
+        self.cache.store(key, '{}', {}, 60)
+        accessed = self.cache.get(key)['accessed']
+        self.cache.flush()
+
+        self.assertFalse(self.cache.dirty)
+        self.assertEqual(ResponseCache(self.path).index[key]['accessed'], accessed)
+
+
+if __name__ == '__main__':
+    unittest.main()
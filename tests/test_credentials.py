@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from resources.lib.psvue import psvue
+
+
+class CredentialsTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read_file(self):
+        with open(os.path.join(self.path, 'credentials'), 'r') as fh_credentials:
+            return json.loads(fh_credentials.read())
+
+    def test_threads_share_one_new_device_id(self):
+        vue = psvue(self.path)
+        start = threading.Event()
+        device_ids = []
+
+        def first_access():
+            start.wait()
+            device_ids.append(vue.credentials['device_id'])
+        threads = [threading.Thread(target=first_access) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(device_ids), set([self.read_file()['device_id']]))
+
+    def test_concurrent_saves_are_all_written(self):
+        vue = psvue(self.path)
+        threads = [threading.Thread(target=vue.save_credentials, kwargs={'profile_id': 1}),
+                   threading.Thread(target=vue.save_credentials, kwargs={'code': 'grant code'}),
+                   threading.Thread(target=vue.save_credentials, kwargs={'renewal_attempted': 1000000000})]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.read_file(), vue.get_credentials())
+        self.assertEqual(self.read_file()['code'], 'grant code')
+
+
+if __name__ == '__main__':
+    unittest.main()
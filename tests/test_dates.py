@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import unittest
+from datetime import datetime
+
+from benchmarks.dates import iso8601_parse_datetime, airing_dates, clear_memo
+from resources.lib.psvue import psvue, parse_api_datetime
+
+
+class DateParsingTest(unittest.TestCase):
+    def setUp(self):
+        self.vue = psvue.__new__(psvue)
+
+    def test_matches_iso8601_path(self):
+        for date in airing_dates(48) + ['2017-03-12T09:30:00.123Z', '2017-11-05T06:59:59Z']:
+            self.assertEqual(self.vue.parse_datetime(date, localize=True), iso8601_parse_datetime(date))
+
+    def test_other_formats_fall_back_to_iso8601(self):
+        self.assertIsNone(parse_api_datetime('2017-03-01T20:00:00+01:00'))
+        self.assertEqual(self.vue.parse_datetime('2017-03-01T20:00:00+01:00').utctimetuple()[:5], (2017, 3, 1, 19, 0))
+
+    def test_fast_parser_keeps_milliseconds(self):
+        self.assertEqual(parse_api_datetime('2017-03-01T20:00:00.25Z').microsecond, 250000)
+
+
+class HalfHourZoneTest(unittest.TestCase):
+    """DST in Adelaide and St. John's starts and ends on the half hour in UTC."""
+
+    def setUp(self):
+        self.tz = os.environ.get('TZ')
+        self.vue = psvue.__new__(psvue)
+
+    def tearDown(self):
+        if self.tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+        clear_memo()
+
+    def use_zone(self, zone):
+        os.environ['TZ'] = zone
+        time.tzset()
+        clear_memo()
+
+    def test_dst_changes_match_iso8601_path(self):
+        # the end and start of DST in Adelaide in 2017 and its end in St. John's, all at half past a UTC hour
+        for zone, change in (('Australia/Adelaide', 1491064200), ('Australia/Adelaide', 1506789000),
+                             ('America/St_Johns', 1509856200)):
+            self.use_zone(zone)
+            for minutes in range(-60, 60, 5):
+                date = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(change + minutes * 60))
+                self.assertEqual(self.vue.parse_datetime(date, localize=True), iso8601_parse_datetime(date), date)
+
+    def test_within_half_an_hour_after_a_dst_change(self):
+        self.use_zone('Australia/Adelaide')
+        self.vue.parse_datetime('2017-09-30T16:10:00.000Z', localize=True)  # before the change, same UTC hour
+        self.assertEqual(self.vue.parse_datetime('2017-09-30T16:48:20.000Z', localize=True),
+                         datetime(2017, 10, 1, 3, 18, 20))
+        self.use_zone('America/St_Johns')
+        self.vue.parse_datetime('2017-11-05T04:15:00.000Z', localize=True)
+        self.assertEqual(self.vue.parse_datetime('2017-11-05T04:45:00.000Z', localize=True),
+                         datetime(2017, 11, 5, 1, 15))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import unittest
+from urllib import urlencode
+
+from benchmarks.hls import MANIFEST_URL, HEADER, load_manifest, generated_manifest, m3u8_parse_manifest
+from resources.lib.hls import parse_master_playlist, first_segment
+
+
+class MasterPlaylistTest(unittest.TestCase):
+    def parse(self, content):
+        return parse_master_playlist(content, MANIFEST_URL, '|suffix')
+
+    def test_matches_m3u8_path(self):
+        for content in (load_manifest(), generated_manifest()):
+            variants = parse_master_playlist(content, MANIFEST_URL, '|' + urlencode(HEADER))
+            streams = dict((str(variant['bitrate']), variant['url']) for variant in variants)
+            self.assertEqual(streams, m3u8_parse_manifest(content, MANIFEST_URL, HEADER))
+
+    def test_variants_are_sorted_and_i_frame_streams_skipped(self):
+        variants = self.parse(load_manifest())
+        self.assertEqual([variant['bitrate'] for variant in variants], [6628, 4628, 3128, 1928, 1128, 628])
+        self.assertEqual(variants[0]['resolution'], '1280x720')
+        self.assertEqual(variants[0]['codecs'], 'avc1.64001f,mp4a.40.2')
+        self.assertEqual(variants[0]['url'], 'https://vue-live.totsuko.tv/hls/20000/6628/index.m3u8|suffix')
+
+    def test_absolute_uris_are_kept(self):
+        content = '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=128000\nhttps://cdn.example.com/low.m3u8\n'
+        self.assertEqual(self.parse(content)[0]['url'], 'https://cdn.example.com/low.m3u8|suffix')
+
+    def test_first_segment(self):
+        playlist = '#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXTINF:6.0,\nsegment1.ts\n#EXTINF:6.0,\nsegment2.ts\n'
+        self.assertEqual(first_segment(playlist, 'https://cdn.example.com/6628/index.m3u8'),
+                         'https://cdn.example.com/6628/segment1.ts')
+        self.assertIsNone(first_segment('#EXTM3U\n', 'https://cdn.example.com/index.m3u8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
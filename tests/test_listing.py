@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+from tests import kodi_env
+
+
+def channels(count):
+    return [{'id': index, 'sentv_type': 'channel', 'title': 'Channel %s' % index} for index in range(count)]
+
+
+class NextPageTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        kodi_env.configure(self.path, {'use_service': 'false', 'page_size': '5', 'prewarm_channels': '0'})
+        kodi_env.xbmcplugin.reset()
+        self.plugin = kodi_env.load_script('default')
+        self.requested = []
+
+        def get_programs(request_method, uri=None, program_id=None, search_query=None, expiration_filter=None,
+                         offset='0', size='999'):
+            self.requested.append(uri)
+            return channels(5)
+        self.plugin.vue.get_programs = get_programs
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def labels(self):
+        return [listitem.label for url, listitem, folder in kodi_env.xbmcplugin.items]
+
+    def test_full_page_of_a_pageable_uri_gets_a_next_page_item(self):
+        self.plugin.list_programs('get', 'channels/items/all/offset/<offset>/size/<size>')
+        self.assertEqual(self.requested, ['channels/items/all/offset/<offset>/size/<size>'])
+        self.assertEqual(len(self.labels()), 6)
+        self.assertEqual(self.labels()[-1], self.plugin.language(30030))
+
+    def test_uri_without_offset_gets_no_next_page_item(self):
+        self.plugin.list_programs('get', 'channels/items/favorites')
+        self.assertEqual(len(self.labels()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
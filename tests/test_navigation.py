@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import threading
+import unittest
+
+from benchmarks import navigation
+from tests.kodi_env import ROOT
+
+
+class NavigationBenchmarkTest(unittest.TestCase):
+    """Every action of the navigation benchmark has to work against the fixtures, or its timings mean nothing."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = navigation.FixtureServer()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.settings = navigation.default_settings(ROOT)
+        cls.settings.update(navigation.SETTINGS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def test_every_action_lists_or_plays_something(self):
+        for action, paramstring, text, answers in navigation.ACTIONS:
+            result = navigation.measure(self.server, ROOT, self.settings, action, paramstring, text, answers, 1)
+            self.assertEqual(result['exit_code'], None, action)
+            if action in ('dialog', 'export_pvr'):
+                self.assertEqual(len(result['dialogs']), 1, action)
+            elif action.startswith('play'):
+                self.assertEqual(result['resolved'], 1, action)
+            else:
+                self.assertTrue(result['items'], action)
+                self.assertEqual(result['dialogs'], [], action)
+
+    def test_listings_are_paged(self):
+        action, paramstring, text, answers = [entry for entry in navigation.ACTIONS if entry[0] == 'list_programs'][0]
+        result = navigation.measure(self.server, ROOT, self.settings, action, paramstring, text, answers, 2)
+        self.assertEqual(result['items'], int(self.settings['page_size']) + 1)  # and the next page item
+        self.assertEqual(result['cold']['requests'], 2)  # the config and the page
+        self.assertEqual(result['warm']['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
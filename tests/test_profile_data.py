@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import time
+import unittest
+
+from resources.lib.psvue import psvue
+
+
+def api_date(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+class ProfileDataTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.vue = psvue(self.path)
+        self.vue.save_credentials(profile_id=1, profile_data={'profile_data': {'favorites': []}},
+                                  profile_data_time=time.time() - 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_new_favorite_invalidates_profile_data(self):
+        self.vue.check_favorites([{'id': 1}, {'id': 2, 'favorite_date': api_date(time.time() - 10)}])
+        self.assertFalse(self.vue.is_profile_data_fresh())
+
+    def test_older_favorites_keep_profile_data(self):
+        self.vue.check_favorites([{'id': 2, 'favorite_date': api_date(time.time() - 3600)}])
+        self.assertTrue(self.vue.is_profile_data_fresh())
+
+
+if __name__ == '__main__':
+    unittest.main()
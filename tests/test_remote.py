@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from tests import kodi_env
+from resources.lib.psvue import psvue
+from resources.lib.remote import VueServer, VueClient, TOKEN_FILE, create_token, read_token
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class VueServerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.token = create_token(os.path.join(self.path, TOKEN_FILE))
+        self.server = VueServer(lambda: psvue(self.path), 0, self.token)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.path)
+
+    def test_token_file_is_private(self):
+        self.assertEqual(os.stat(os.path.join(self.path, TOKEN_FILE)).st_mode & 0o077, 0)
+        self.assertEqual(read_token(os.path.join(self.path, TOKEN_FILE)), self.token)
+
+    def test_calls_are_forwarded(self):
+        client = VueClient(self.port, self.token)
+        self.assertTrue(client.is_running())
+        self.assertEqual(client.get_stats()['requests'], 0)
+        self.assertEqual(client.get_credentials()['code'], None)
+
+    def test_vue_errors_are_raised_in_the_client(self):
+        client = VueClient(self.port, self.token)
+        with self.assertRaises(client.VueError) as context:
+            client.login()
+        self.assertEqual(context.exception.value, 'No username and password supplied.')
+
+    def test_wrong_token_is_rejected(self):
+        client = VueClient(self.port, 'not the token')
+        self.assertFalse(client.is_running())
+        self.assertRaises(RuntimeError, client.get_credentials)
+
+    def test_only_remote_and_local_methods_are_available(self):
+        client = VueClient(self.port, self.token)
+        self.assertEqual(client.parse_datetime('2017-03-01T20:00:00.000Z').hour, 20)
+        self.assertFalse(hasattr(client, 'renew_session_in_background'))
+        self.assertFalse(hasattr(client, 'resolve_stream_url'))
+        self.assertRaises(RuntimeError, client.call, 'resolve_stream_url', channel_id=1)
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.port = free_port()
+        kodi_env.configure(self.path, {'use_service': 'true', 'service_port': str(self.port), 'log_level': '0'})
+        kodi_env.xbmc.abort_requested.clear()
+
+    def tearDown(self):
+        kodi_env.xbmc.abort_requested.set()
+        shutil.rmtree(self.path)
+
+    def test_service_answers_clients_with_its_token(self):
+        service = kodi_env.load_script('service')
+        thread = threading.Thread(target=service.run)
+        thread.start()
+        try:
+            token_file = os.path.join(self.path, TOKEN_FILE)
+            for _ in range(50):
+                token = read_token(token_file)
+                if token and VueClient(self.port, token).is_running():
+                    break
+                time.sleep(0.1)
+            client = VueClient(self.port, read_token(token_file))
+            self.assertEqual(client.get_stats()['requests'], 0)
+        finally:
+            kodi_env.xbmc.abort_requested.set()
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
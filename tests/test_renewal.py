@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from resources.lib.psvue import psvue
+
+
+class RenewalTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        vue = psvue(self.path)
+        vue.save_credentials(code='grant code', profile_id=1,
+                             expiry_date=(datetime.utcnow() + timedelta(minutes=10)).isoformat())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def failing_vue(self):
+        vue = psvue(self.path)
+
+        def authenticate():
+            raise vue.VueError('Authentication failed.')
+        vue.authenticate = authenticate
+        return vue
+
+    def test_failed_renewal_is_not_retried_by_the_next_invocation(self):
+        vue = self.failing_vue()
+        self.assertTrue(vue.needs_renewal())
+        self.assertFalse(vue.renew_session())
+        self.assertFalse(vue.needs_renewal())
+        self.assertFalse(psvue(self.path).needs_renewal())
+
+    def test_renewal_is_retried_after_the_delay(self):
+        vue = self.failing_vue()
+        vue.renew_session()
+        vue = psvue(self.path)
+        vue.credentials['renewal_attempted'] = time.time() - vue.renewal_retry_delay - 1
+        self.assertTrue(vue.needs_renewal())
+
+
+if __name__ == '__main__':
+    unittest.main()
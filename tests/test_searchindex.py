@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from tests import kodi_env
+from resources.lib.psvue import psvue
+from resources.lib.searchindex import SearchIndex
+
+
+def program(program_id, title):
+    return {'id': program_id, 'sentv_type': 'program', 'title': title, 'airings': [{'channel_name': 'NBC'}]}
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index = SearchIndex(os.path.join(self.path, 'search.db'), max_age=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_add_drops_items_not_listed_within_max_age(self):
+        self.index.add([program(1, 'The Voice'), program(2, 'The Office')])
+        self.index.db.execute('UPDATE items SET updated = ? WHERE key = ?', (time.time() - 7200, 'program:1'))
+        self.index.add([program(3, 'Other')])
+        self.assertEqual([item['id'] for item in self.index.search('the')], [2])
+        rows = self.index.db.execute('SELECT COUNT(*) FROM tokens WHERE key = ?', ('program:1',))
+        self.assertEqual(rows.fetchone()[0], 0)
+
+    def test_channel_airings_are_not_stored(self):
+        channel = {'id': 5, 'sentv_type': 'channel', 'title': 'NBC', 'airings': [{'id': 1}]}
+        self.index.add([channel, program(1, 'NBC News')])
+        items = dict((item['sentv_type'], item) for item in self.index.search('nbc'))
+        self.assertNotIn('airings', items['channel'])
+        self.assertIn('airings', items['program'])
+        self.assertIn('airings', channel)
+
+
+class DeferredIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.vue = psvue(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_listings_are_indexed_on_flush(self):
+        self.vue.index_queue.extend([program(1, 'The Voice')])
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'search.db')))
+        self.vue.flush()
+        self.assertEqual([item['id'] for item in self.vue.search_local('voice')], [1])
+        self.assertEqual(self.vue.index_queue, [])
+
+
+class SearchProgramsTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        kodi_env.configure(self.path, {'use_service': 'false'})
+        self.plugin = kodi_env.load_script('default')
+        self.plugin.vue.search_local = lambda search_query: [program(1, 'The Voice')]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_local_results_are_listed_when_the_server_search_fails(self):
+        def fetch():
+            raise requests.exceptions.ConnectionError('Connection refused')
+        items, server_count = self.plugin.search_programs('voice', fetch)
+        self.assertEqual([item['id'] for item in items], [1])
+        self.assertEqual(server_count, 0)
+
+    def test_local_results_are_listed_when_the_server_rejects_the_search(self):
+        def fetch():
+            raise self.plugin.vue.VueError('Search is unavailable.')
+        self.assertEqual(len(self.plugin.search_programs('voice', fetch)[0]), 1)
+
+    def test_session_errors_are_raised(self):
+        def fetch():
+            raise self.plugin.vue.VueError(psvue.SESSION_ERRORS[0])
+        self.assertRaises(psvue.VueError, self.plugin.search_programs, 'voice', fetch)
+
+
+if __name__ == '__main__':
+    unittest.main()
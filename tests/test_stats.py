@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+import time
+import unittest
+
+from tests import kodi_env
+
+
+class InvocationStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        kodi_env.configure(self.path, {'use_service': 'false', 'record_stats': 'true'})
+        self.plugin = kodi_env.load_script('default')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_summary_keeps_the_request_count_next_to_the_records(self):
+        vue = self.plugin.vue
+        stats_before = vue.get_stats()
+        vue.count('requests', 2)
+        vue.record_request('https://example.com/a', 'get', 'none', time.time(), 200, 10)
+        vue.record_request('https://example.com/b', 'get', 'none', time.time(), 200, 10)
+        self.plugin.log_invocation_stats('list_categories', stats_before, record_stats=True)
+
+        with open(os.path.join(self.path, 'stats.log'), 'r') as fh_stats:
+            summary = json.loads(fh_stats.read().splitlines()[-1])
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual([record['url'] for record in summary['request_records']],
+                         ['https://example.com/a', 'https://example.com/b'])
+        self.assertNotIn('peak_memory_kb', summary)
+
+    def test_phases_are_only_timed_with_stats(self):
+        with self.plugin.timed('listitems'):
+            pass
+        self.assertEqual(self.plugin.phase_timings, {})
+        self.plugin.timing_phases = True
+        with self.plugin.timed('listitems'):
+            pass
+        self.assertIn('listitems', self.plugin.phase_timings)
+
+
+if __name__ == '__main__':
+    unittest.main()
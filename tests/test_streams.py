@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from resources.lib.psvue import psvue, VueResponse
+
+MASTER_PLAYLIST = '''#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=1128000,RESOLUTION=640x360
+low.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5128000,RESOLUTION=1280x720
+high.m3u8
+'''
+
+
+class FakeVue(psvue):
+    """Answers the stream and manifest requests of airing N with reqPayload cookie payload-N.
+    The stream requests wait for each other so the responses overlap like in a parallel resolve."""
+
+    def __init__(self, save_path, airings):
+        psvue.__init__(self, save_path)
+        self.lock = threading.Lock()
+        self.waiting = airings
+        self.all_started = threading.Event()
+
+    def make_request(self, url, method, payload=None, headers=None):
+        airing_id = url.split('/')[-1].split('.')[0]
+        if '/stream/airing/' in url:
+            with self.lock:
+                self.waiting -= 1
+                if not self.waiting:
+                    self.all_started.set()
+            self.all_started.wait(5)
+            content = json.dumps({'header': {}, 'body': {'video': 'https://cdn.example.com/%s.m3u8' % airing_id}})
+            return VueResponse(200, {}, content, cookies={'reqPayload': 'payload-%s' % airing_id})
+        return VueResponse(200, {}, MASTER_PLAYLIST)
+
+
+class StreamResolutionTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_parallel_streams_keep_their_own_req_payload(self):
+        vue = FakeVue(self.path, 3)
+        streams = vue.resolve_streams(['1', '2', '3'])
+        for airing_id, future in streams.items():
+            for variant in future.result(5)['variants']:
+                self.assertIn('reqPayload%%3Dpayload-%s' % airing_id, variant['url'])
+
+    def test_variants_are_sorted_by_bitrate(self):
+        variants = FakeVue(self.path, 1).resolve_stream_url(airing_id='1')['variants']
+        self.assertEqual([variant['bitrate'] for variant in variants], [5128, 1128])
+        self.assertEqual(variants[1]['url'].split('|')[0], 'https://cdn.example.com/low.m3u8')
+
+
+if __name__ == '__main__':
+    unittest.main()
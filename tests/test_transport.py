@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+import requests
+
+from resources.lib.psvue import psvue
+
+
+class ScriptedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer each request with the next (status, delay) from the server's script, 200 once it runs out."""
+
+    def respond(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            status, delay = server.script.pop(0) if server.script else (200, 0)
+        if self.headers.get('Content-Length'):
+            self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(delay)
+        body = json.dumps({'header': {'code': status}, 'body': {'status': status}})
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except socket.error:
+            pass  # the client timed out and went away
+
+    do_GET = do_PUT = do_POST = respond
+
+    def handle(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+        except socket.error:
+            pass  # flushing the response to a client that timed out and went away
+
+    def finish(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class ScriptedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), ScriptedHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.script = []
+
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ScriptedServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/items' % self.server.server_address[1]
+        self.path = tempfile.mkdtemp()
+        self.vue = psvue(self.path, timeout=(1, 0.3))
+        self.vue.retry_backoff = 0.01
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def test_slow_response_times_out_after_retries(self):
+        self.server.script = [(200, 1)] * 3
+        self.assertRaises(requests.exceptions.Timeout, self.vue.send_request, self.url, 'get')
+        self.assertEqual(len(self.server.requests), self.vue.max_retries + 1)
+
+    def test_server_error_is_retried(self):
+        self.server.script = [(503, 0), (502, 0)]
+        response = self.vue.make_request(self.url, 'get')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, {'status': 200})
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.vue.get_stats()['requests'], 1)
+
+    def test_server_error_is_returned_when_retries_run_out(self):
+        self.server.script = [(503, 0)] * 3
+        self.assertEqual(self.vue.send_request(self.url, 'get').status_code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_post_is_not_retried(self):
+        self.server.script = [(503, 0)]
+        self.assertEqual(self.vue.send_request(self.url, 'post', payload='{}').status_code, 503)
+        self.assertEqual(self.server.requests, [('POST', '/items')])
+
+    def test_connection_refused(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%s/items' % sock.getsockname()[1]
+        sock.close()  # nothing listens on the port anymore
+        messages = []
+        self.vue.log = lambda string, *args, **kwargs: messages.append(string)
+        self.assertRaises(requests.exceptions.ConnectionError, self.vue.make_request, url, 'get')
+        self.assertEqual(messages.count('Request failed (%s), retrying.'), self.vue.max_retries)
+        self.assertEqual(self.vue.get_request_records()[-1]['status'], None)
+
+
+if __name__ == '__main__':
+    unittest.main()